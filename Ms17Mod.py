@@ -6,16 +6,42 @@ ATTENZIONE: Usare a proprio rischio. Solo per scopi educativi.
 
 import os
 import sys
-import requests
-import zipfile
+import io
+import argparse
 import shutil
-import subprocess
+import select
 import platform
-from pathlib import Path
+from pathlib import Path, PurePosixPath
 import time
 import json
+import mmap
 from datetime import datetime
-import hashlib
+import struct
+import threading
+import importlib
+import importlib.util
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from urllib.parse import urlparse
+
+class _LazyModule:
+    """Modulo importato al primo accesso a un attributo: il primo menu non ne paga il costo"""
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def __getattr__(self, attr):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return getattr(self._module, attr)
+
+requests = _LazyModule("requests")
+zipfile = _LazyModule("zipfile")
+tarfile = _LazyModule("tarfile")
+hashlib = _LazyModule("hashlib")
 
 try:
     from colorama import init, Fore, Back, Style
@@ -24,11 +50,366 @@ try:
 except ImportError:
     COLORAMA_AVAILABLE = False
 
-try:
-    from tqdm import tqdm
-    TQDM_AVAILABLE = True
-except ImportError:
-    TQDM_AVAILABLE = False
+TQDM_AVAILABLE = importlib.util.find_spec("tqdm") is not None
+
+def tqdm(*args, **kwargs):
+    """Barra di progresso tqdm, importata al primo utilizzo"""
+    from tqdm import tqdm as progress_bar
+    return progress_bar(*args, **kwargs)
+
+# Struttura directory della scheda SD preparata
+SD_STRUCTURE = [
+    "3ds",
+    "cias",
+    "files9",
+    "luma",
+    "luma/payloads",
+    "themes",
+    "gm9",
+    "gm9/out",
+    "gm9/scripts"
+]
+
+# File da copiare sulla SD per ogni artefatto: (nome file, cartella di destinazione sulla SD)
+SD_PAYLOADS = {
+    "luma3ds": [("boot.firm", "")],
+    "homebrew_launcher": [("boot.3dsx", "")],
+    "godmode9": [("GodMode9.firm", "luma/payloads")]
+}
+
+# File copiati da install_boot9strap
+BOOT9STRAP_PAYLOADS = {
+    "boot9strap": [("boot9strap.firm", "boot9strap"), ("boot9strap.firm.sha", "boot9strap")]
+}
+
+# Blocco di copia verso la SD: scritture grandi e sequenziali
+SD_COPY_BLOCK = 1024 * 1024
+
+# Manifest sulla SD: file posizionati dal tool, per la sincronizzazione incrementale
+SD_MANIFEST = "ms17mod_manifest.json"
+
+# Byte letti per campione nell'impronta rapida della SD (inizio, metà, fine di ogni file)
+SD_SAMPLE_SIZE = 4096
+
+# Cluster delle immagini FAT32 per la SD (valore consigliato dalla guida 3DS)
+FAT32_CLUSTER_SIZE = 32 * 1024
+
+# Etichette di partizioni FAT che non sono schede SD (EFI, ripristino, ...)
+NON_SD_LABELS = {"EFI", "ESP", "SYSTEM", "BOOT", "RECOVERY", "SYSTEM-BOOT"}
+
+# Dimensioni plausibili per una SD da 3DS
+SD_MIN_SIZE = 1024 ** 3
+SD_MAX_SIZE = 2 * 1024 ** 4
+
+# Membri ZIP oltre questa dimensione vengono estratti in un task dedicato del process pool
+LARGE_MEMBER_SIZE = 8 * 1024 * 1024
+
+def _extract_members_worker(archive_path, extract_dir, member_names):
+    """Estrae i membri indicati in un processo separato, con verifica CRC in streaming"""
+    start = time.monotonic()
+    extracted = []
+    failed = []
+    size = 0
+    with zipfile.ZipFile(archive_path, 'r') as zip_ref:
+        for name in member_names:
+            info = zip_ref.getinfo(name)
+            try:
+                # extract() legge a blocchi e solleva BadZipFile se il CRC-32 non corrisponde
+                zip_ref.extract(info, extract_dir)
+                extracted.append(name)
+                size += info.file_size
+            except Exception as e:
+                failed.append(f"{name}: {e}")
+    return {"extracted": extracted, "failed": failed, "bytes": size, "elapsed": time.monotonic() - start}
+
+def _read_json(path, default):
+    """Legge un file JSON; default se assente, illeggibile o di tipo diverso da default"""
+    try:
+        with open(path, 'r') as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return default
+    return data if default is None or isinstance(data, type(default)) else default
+
+def _write_json_atomic(path, obj):
+    """Scrive un file JSON in modo atomico (file .tmp accanto e os.replace)"""
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+    with open(tmp_path, 'w') as f:
+        json.dump(obj, f, indent=4)
+    os.replace(tmp_path, path)
+
+class _RangeNotHonored(Exception):
+    """Il server ha risposto 200 a una richiesta Range: il file va scaricato in un unico flusso"""
+
+class _HashingReader:
+    """File-like che calcola lo SHA-256 dei dati mentre vengono letti"""
+    def __init__(self, fileobj):
+        self.fileobj = fileobj
+        self.hasher = hashlib.sha256()
+
+    def read(self, size=-1):
+        data = self.fileobj.read(size)
+        self.hasher.update(data)
+        return data
+
+class _MultiHasher:
+    """Più digest (es. MD5, SHA-1, SHA-256) calcolati in un solo passaggio sui dati"""
+    def __init__(self, algorithms=("md5", "sha1", "sha256")):
+        self.hashers = {algorithm: hashlib.new(algorithm) for algorithm in algorithms}
+
+    def update(self, data):
+        for hasher in self.hashers.values():
+            hasher.update(data)
+
+    def hexdigests(self):
+        return {algorithm: hasher.hexdigest() for algorithm, hasher in self.hashers.items()}
+
+class _PrefixHasher:
+    """Digest del prefisso contiguo già scritto di un file a segmenti, aggiornato mentre i segmenti arrivano"""
+    def __init__(self, hasher, path, segments):
+        self.hasher = hasher
+        self.path = path
+        self.segments = segments
+        self.offset = 0
+        self.lock = threading.Lock()
+
+    def _contiguous_end(self):
+        """Fine del tratto scritto senza buchi a partire da offset"""
+        end = self.offset
+        for segment in self.segments:
+            if segment['end'] < self.offset:
+                continue
+            end = segment['start'] + segment['done']
+            if end <= segment['end']:
+                break
+        return end
+
+    def _catch_up(self):
+        # Byte già sul file (segmenti ripresi o arrivati prima del prefisso): letti una sola volta
+        while self._contiguous_end() > self.offset:
+            with open(self.path, 'rb') as f:
+                f.seek(self.offset)
+                remaining = self._contiguous_end() - self.offset
+                while remaining:
+                    block = f.read(min(remaining, 1024 * 1024))
+                    if not block:
+                        return
+                    self.hasher.update(block)
+                    self.offset += len(block)
+                    remaining -= len(block)
+
+    def update(self, offset, chunk):
+        """Dopo la scrittura di un blocco: se prosegue il prefisso lo si usa dalla memoria"""
+        # Se un altro thread sta recuperando, leggerà anche questo blocco dal file
+        if not self.lock.acquire(blocking=False):
+            return
+        try:
+            if offset == self.offset:
+                self.hasher.update(chunk)
+                self.offset += len(chunk)
+            self._catch_up()
+        finally:
+            self.lock.release()
+
+    def finish(self):
+        """Completa il prefisso e restituisce quanti byte coprono i digest"""
+        with self.lock:
+            self._catch_up()
+            return self.offset
+
+class _Fat32Image:
+    """Volume FAT32 (senza tabella delle partizioni) costruito in un file immagine locale"""
+    SECTOR_SIZE = 512
+    RESERVED_SECTORS = 32
+    NUM_FATS = 2
+    END_OF_CHAIN = 0x0FFFFFFF
+    SHORT_NAME_CHARS = set("ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789!#$%&'()-@^_`{}~")
+
+    def __init__(self, total_sectors, cluster_size=FAT32_CLUSTER_SIZE, label="3DS"):
+        self.total_sectors = total_sectors
+        self.cluster_size = cluster_size
+        self.sectors_per_cluster = cluster_size // self.SECTOR_SIZE
+        self.label = label.upper()[:11].ljust(11).encode("ascii")
+        # Formula Microsoft per la dimensione della FAT
+        self.fat_sectors = -(-(total_sectors - self.RESERVED_SECTORS)
+                             // ((256 * self.sectors_per_cluster + self.NUM_FATS) // 2))
+        data_sectors = total_sectors - self.RESERVED_SECTORS - self.NUM_FATS * self.fat_sectors
+        self.cluster_count = data_sectors // self.sectors_per_cluster
+        if self.cluster_count < 65525 or total_sectors > 0xFFFFFFFF:
+            raise ValueError(f"dimensione non valida per FAT32 con cluster da {cluster_size // 1024} KiB")
+        self.data_offset = (self.RESERVED_SECTORS + self.NUM_FATS * self.fat_sectors) * self.SECTOR_SIZE
+        self.fat = [0x0FFFFFF8, self.END_OF_CHAIN]
+        self.root = {"name": "", "dir": True, "children": {}}
+        self.timestamp = time.localtime()
+
+    def add_dir(self, rel_path):
+        """Aggiunge una directory (e le intermedie) all'albero del volume"""
+        node = self.root
+        for part in PurePosixPath(rel_path).parts:
+            node = node["children"].setdefault(part, {"name": part, "dir": True, "children": {}})
+        return node
+
+    def add_file(self, rel_path, size, opener):
+        """Aggiunge un file: opener() restituisce un file-like con il contenuto"""
+        rel_path = PurePosixPath(rel_path)
+        parent = self.add_dir(rel_path.parent) if rel_path.parent.parts else self.root
+        parent["children"][rel_path.name] = {"name": rel_path.name, "dir": False, "size": size, "opener": opener}
+
+    def _allocate(self, clusters):
+        """Catena di cluster contigui in coda a quelli già usati (0 se vuota)"""
+        if clusters == 0:
+            return 0
+        first = len(self.fat)
+        if first + clusters - 2 > self.cluster_count:
+            raise ValueError("contenuto troppo grande per il volume")
+        self.fat.extend(range(first + 1, first + clusters))
+        self.fat.append(self.END_OF_CHAIN)
+        return first
+
+    def _short_name(self, name, used):
+        """Nome 8.3 univoco nella directory, True se serve anche il nome lungo (LFN)"""
+        base, dot, ext = name.rpartition(".")
+        if not dot or not base:
+            base, ext = name, ""
+        clean_base = "".join(c for c in base.upper() if c in self.SHORT_NAME_CHARS)
+        clean_ext = "".join(c for c in ext.upper() if c in self.SHORT_NAME_CHARS)[:3]
+        fits = clean_base == base.upper() and clean_ext == ext.upper() and 0 < len(base) <= 8
+        if fits:
+            short = clean_base.ljust(8) + clean_ext.ljust(3)
+            if short not in used:
+                used.add(short)
+                return short.encode("ascii"), name != name.upper()
+        number = 1
+        while True:
+            tail = f"~{number}"
+            short = (clean_base[:8 - len(tail)] + tail).ljust(8) + clean_ext.ljust(3)
+            if short not in used:
+                used.add(short)
+                return short.encode("ascii"), True
+            number += 1
+
+    def _lfn_entries(self, name, short):
+        """Voci LFN (in ordine inverso, come su disco) per il nome lungo"""
+        checksum = 0
+        for byte in short:
+            checksum = (((checksum & 1) << 7) + (checksum >> 1) + byte) & 0xFF
+        raw = name.encode("utf-16-le")
+        chars = [raw[i:i + 2] for i in range(0, len(raw), 2)]
+        if len(chars) % 13:
+            chars.append(b"\0\0")
+        chars.extend([b"\xff\xff"] * (-len(chars) % 13))
+        entries = []
+        for seq, start in enumerate(range(0, len(chars), 13), 1):
+            part = chars[start:start + 13]
+            order = seq | (0x40 if start + 13 >= len(chars) else 0)
+            entries.append(struct.pack("<B10sBBB12sH4s", order, b"".join(part[:5]), 0x0F, 0, checksum,
+                                       b"".join(part[5:11]), 0, b"".join(part[11:])))
+        return b"".join(reversed(entries))
+
+    def _entry(self, short, attr, cluster, size=0):
+        """Voce di directory da 32 byte"""
+        t = self.timestamp
+        fat_date = ((t.tm_year - 1980) << 9) | (t.tm_mon << 5) | t.tm_mday
+        fat_time = (t.tm_hour << 11) | (t.tm_min << 5) | (t.tm_sec // 2)
+        return struct.pack("<11sBBBHHHHHHHI", short, attr, 0, 0, fat_time, fat_date, fat_date,
+                           cluster >> 16, fat_time, fat_date, cluster & 0xFFFF, size)
+
+    def _layout(self, node):
+        """Assegna i cluster in ordine di scrittura: directory, poi il suo contenuto"""
+        used = set()
+        entries = 1 if node is self.root else 2
+        for child in node["children"].values():
+            child["short"], lfn = self._short_name(child["name"], used)
+            child["lfn"] = self._lfn_entries(child["name"], child["short"]) if lfn else b""
+            entries += 1 + len(child["lfn"]) // 32
+        node["clusters"] = -(-entries * 32 // self.cluster_size)
+        node["cluster"] = self._allocate(node["clusters"])
+        order = [node]
+        for child in node["children"].values():
+            if child["dir"]:
+                order.extend(self._layout(child))
+            else:
+                child["cluster"] = self._allocate(-(-child["size"] // self.cluster_size))
+                order.append(child)
+        return order
+
+    def _dir_bytes(self, node, parent):
+        """Contenuto dei cluster di una directory"""
+        if node is self.root:
+            data = [self._entry(self.label, 0x08, 0)]
+        else:
+            parent_cluster = 0 if parent is self.root else parent["cluster"]
+            data = [self._entry(b".          ", 0x10, node["cluster"]),
+                    self._entry(b"..         ", 0x10, parent_cluster)]
+        for child in node["children"].values():
+            data.append(child["lfn"])
+            if child["dir"]:
+                data.append(self._entry(child["short"], 0x10, child["cluster"]))
+            else:
+                data.append(self._entry(child["short"], 0x20, child["cluster"], child["size"]))
+        return b"".join(data).ljust(node["clusters"] * self.cluster_size, b"\0")
+
+    def _boot_sector(self):
+        """Settore di avvio con BPB FAT32"""
+        boot = struct.pack("<3s8sHBHBHHBHHHIIIHHIHH12sBBBI11s8s",
+                           b"\xEB\x58\x90", b"MSWIN4.1", self.SECTOR_SIZE, self.sectors_per_cluster,
+                           self.RESERVED_SECTORS, self.NUM_FATS, 0, 0, 0xF8, 0, 63, 255, 0,
+                           self.total_sectors, self.fat_sectors, 0, 0, 2, 1, 6, b"\0" * 12,
+                           0x80, 0, 0x29, int(time.time()) & 0xFFFFFFFF, self.label, b"FAT32   ")
+        return boot.ljust(510, b"\0") + b"\x55\xAA"
+
+    def _fsinfo_sector(self):
+        """Settore FSInfo con il conteggio dei cluster liberi"""
+        free = self.cluster_count - (len(self.fat) - 2)
+        sector = bytearray(self.SECTOR_SIZE)
+        struct.pack_into("<I", sector, 0, 0x41615252)
+        struct.pack_into("<IIII", sector, 484, 0x61417272, free, len(self.fat), 0)
+        struct.pack_into("<I", sector, 508, 0xAA550000)
+        return bytes(sector)
+
+    def write(self, path, block_size=SD_COPY_BLOCK):
+        """Scrive l'immagine in sequenza, fino all'ultimo cluster usato"""
+        order = self._layout(self.root)
+        parents = {}
+        for node in order:
+            for child in node.get("children", {}).values():
+                parents[id(child)] = node
+        
+        with open(path, 'wb') as f:
+            boot = self._boot_sector()
+            fsinfo = self._fsinfo_sector()
+            reserved = bytearray(self.RESERVED_SECTORS * self.SECTOR_SIZE)
+            for sector, data in ((0, boot), (1, fsinfo), (6, boot), (7, fsinfo)):
+                reserved[sector * self.SECTOR_SIZE:(sector + 1) * self.SECTOR_SIZE] = data
+            f.write(reserved)
+            
+            fat_bytes = struct.pack(f"<{len(self.fat)}I", *self.fat)
+            for _ in range(self.NUM_FATS):
+                f.write(fat_bytes)
+                # Il resto della FAT (cluster liberi) deve essere azzerato sul dispositivo
+                remaining = self.fat_sectors * self.SECTOR_SIZE - len(fat_bytes)
+                while remaining > 0:
+                    chunk = min(remaining, block_size)
+                    f.write(bytes(chunk))
+                    remaining -= chunk
+            
+            for node in order:
+                if node["cluster"] == 0:
+                    continue
+                f.seek(self.data_offset + (node["cluster"] - 2) * self.cluster_size)
+                if node["dir"]:
+                    f.write(self._dir_bytes(node, parents.get(id(node))))
+                else:
+                    written = 0
+                    with node["opener"]() as src:
+                        for block in iter(lambda: src.read(block_size), b''):
+                            f.write(block)
+                            written += len(block)
+                    if written != node["size"]:
+                        raise ValueError(f"dimensione inattesa per {node['name']}")
+                    # Coda dell'ultimo cluster esplicita: l'immagine si scrive così com'è
+                    f.write(bytes(-written % self.cluster_size))
 
 class ThreeDSModTool:
     def __init__(self):
@@ -38,6 +419,27 @@ class ThreeDSModTool:
         self.downloads_dir = self.base_dir / "downloads"
         self.sd_card_path = None
         self.config_file = self.base_dir / "config.json"
+        self.cache_dir = self.base_dir / "cache"
+        self._cache_lock = threading.Lock()
+        self._cache_index = None
+        self._session = None
+        self._probe_session = None
+        self._release_cache = None
+        self._release_lock = threading.Lock()
+        self._artifact_locks = {}
+        self._artifact_locks_guard = threading.Lock()
+        self.download_errors = {}
+        self._prefetch_thread = None
+        self._artifact_index = None
+        self._index_lock = threading.Lock()
+        self._manifest_lock = threading.Lock()
+        self._grades_lock = threading.Lock()
+        self._hash_cache = None
+        self._hash_lock = threading.Lock()
+        self._probe_cache = {}
+        self._probe_lock = threading.Lock()
+        self.prefetch_status = {}
+        self._session_lock = threading.Lock()
         self.setup_directories()
         self.load_config()
         
@@ -48,17 +450,51 @@ class ThreeDSModTool:
             self.base_dir / "backups",
             self.base_dir / "logs",
             self.base_dir / "temp",
-            self.base_dir / "files"
+            self.base_dir / "files",
+            self.cache_dir / "objects"
         ]
         
         for directory in directories:
-            directory.mkdir(exist_ok=True)
+            directory.mkdir(parents=True, exist_ok=True)
             
     def load_config(self):
         """Carica la configurazione"""
         default_config = {
             "sd_card_path": "",
             "auto_detect_sd": True,
+            "max_concurrent_downloads": 6,
+            "cache_max_mb": 1024,
+            "http_connect_timeout": 5,
+            "http_read_timeout": 30,
+            "http_retries": 3,
+            "http_pool_size": 10,
+            "segmented_download_min_mb": 4,
+            "download_segments": 4,
+            "local_mirrors": [],
+            "mirror_probe_timeout": 3,
+            "github_api_url": "https://api.github.com",
+            "github_token": "",
+            "release_cache_ttl": 3600,
+            "background_prefetch": False,
+            "pipeline_extract_workers": 2,
+            "pipeline_sd_workers": 1,
+            "selective_extract": False,
+            "extract_workers": 0,
+            "stream_from_zip": True,
+            "sd_copy_block_kb": 4096,
+            "sd_copy_workers": 4,
+            "sd_small_file_kb": 1024,
+            "sd_bench_mb": 64,
+            "sd_bench_small_files": 256,
+            "sd_min_write_mbs": 4,
+            "sd_verify": True,
+            "hash_workers": 0,
+            "expected_checksums": {},
+            "download_digests": ["md5", "sha1", "sha256"],
+            "probe_deadline": 5,
+            "probe_cache_ttl": 30,
+            "startup_budget_ms": 300,
+            "startup_benchmark_runs": 5,
             "download_mirrors": {
                 "boot9strap": "https://github.com/SciresM/boot9strap/releases/download/1.4/boot9strap-1.4.zip",
                 "luma3ds": "https://github.com/LumaTeam/Luma3DS/releases/download/v13.0/Luma3DSv13.0.zip",
@@ -70,22 +506,17 @@ class ThreeDSModTool:
         }
         
         if self.config_file.exists():
-            try:
-                with open(self.config_file, 'r') as f:
-                    self.config = json.load(f)
-                    # Carica il percorso SD dalla config
-                    if self.config.get('sd_card_path'):
-                        self.sd_card_path = Path(self.config['sd_card_path'])
-            except:
-                self.config = default_config
+            self.config = _read_json(self.config_file, default_config)
+            # Carica il percorso SD dalla config
+            if self.config.get('sd_card_path'):
+                self.sd_card_path = Path(self.config['sd_card_path'])
         else:
             self.config = default_config
             self.save_config()
     
     def save_config(self):
         """Salva la configurazione"""
-        with open(self.config_file, 'w') as f:
-            json.dump(self.config, f, indent=4)
+        _write_json_atomic(self.config_file, self.config)
     
     def clear_screen(self):
         """Pulisce lo schermo"""
@@ -145,18 +576,9 @@ class ThreeDSModTool:
     
     def check_dependencies(self):
         """Controlla che tutte le dipendenze siano installate"""
-        missing_deps = []
+        # find_spec non importa i moduli: requests resta caricato solo al primo utilizzo
+        missing_deps = [dep for dep in ("requests", "colorama") if importlib.util.find_spec(dep) is None]
         
-        try:
-            import requests
-        except ImportError:
-            missing_deps.append("requests")
-            
-        try:
-            import colorama
-        except ImportError:
-            missing_deps.append("colorama")
-            
         if missing_deps:
             print(self.colorize("❌ Dipendenze mancanti:", "red"))
             for dep in missing_deps:
@@ -165,69 +587,739 @@ class ThreeDSModTool:
             return False
         return True
 
-    def download_with_progress(self, url, filename):
-        """Download con barra di progresso"""
+    def get_session(self):
+        """Sessione HTTP condivisa (keep-alive, pool di connessioni e retry)"""
+        with self._session_lock:
+            if self._session is None:
+                from urllib3.util.retry import Retry
+                retries = Retry(
+                    total=self.config.get("http_retries", 3),
+                    backoff_factor=0.5,
+                    status_forcelist=(429, 500, 502, 503, 504),
+                    allowed_methods=frozenset(["GET", "HEAD"]),
+                    respect_retry_after_header=True
+                )
+                # Il pool deve bastare a tutti i download simultanei verso lo stesso host
+                pool_size = max(
+                    self.config.get("http_pool_size", 10),
+                    self.config.get("max_concurrent_downloads", 6)
+                )
+                self._session = self._build_session(pool_size, retries)
+            return self._session
+
+    def get_probe_session(self):
+        """Sessione senza retry per i controlli di connettività (un solo tentativo entro il timeout)"""
+        with self._session_lock:
+            if self._probe_session is None:
+                self._probe_session = self._build_session(self.config.get("http_pool_size", 10), 0)
+            return self._probe_session
+
+    def _build_session(self, pool_size, retries):
+        """Crea una sessione requests con pool di connessioni e politica di retry"""
+        from requests.adapters import HTTPAdapter
+        adapter = HTTPAdapter(
+            pool_connections=pool_size,
+            pool_maxsize=pool_size,
+            max_retries=retries
+        )
+        session = requests.Session()
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        session.headers["User-Agent"] = f"Ms17Mod/{self.version}"
+        return session
+
+    def get_http_timeout(self, read_timeout=None):
+        """Timeout (connessione, lettura) configurati per le richieste HTTP"""
+        if read_timeout is None:
+            read_timeout = self.config.get("http_read_timeout", 30)
+        return (self.config.get("http_connect_timeout", 5), read_timeout)
+
+    def _artifact_lock(self, filename):
+        """Lock per artefatto: prefetch e download espliciti non si sovrappongono"""
+        with self._artifact_locks_guard:
+            return self._artifact_locks.setdefault(filename, threading.Lock())
+
+    def download_with_progress(self, url, filename, quiet=False, extract=True):
+        """Download con barra di progresso (quiet=True per i download concorrenti)"""
+        # Se lo stesso artefatto è già in download (es. prefetch) si attende e si riusa la cache
+        with self._artifact_lock(filename):
+            return self._download_with_progress(url, filename, quiet, extract)
+
+    def _download_with_progress(self, url, filename, quiet, extract):
+        """Corpo di download_with_progress, eseguito sotto il lock dell'artefatto"""
+        self.download_errors.pop(filename, None)
         try:
             filepath = self.downloads_dir / filename
+            # Il download avviene in un file .part rinominato solo a trasferimento completo
+            part_path = filepath.with_name(filepath.name + ".part")
             
-            # Head request per ottenere la dimensione
-            try:
-                response = requests.head(url, timeout=10)
-                if 'content-length' in response.headers:
-                    total_size = int(response.headers['content-length'])
-                else:
-                    total_size = 0
-            except:
-                total_size = 0
+            # url può essere un singolo URL o una lista ordinata di mirror
+            mirrors = [url] if isinstance(url, str) else list(url)
+            if len(mirrors) > 1:
+                mirrors = self.rank_mirrors(mirrors, filename, quiet)
             
-            # Download con progress bar
-            response = requests.get(url, stream=True, timeout=30)
-            response.raise_for_status()
+            # Failover: se un mirror cade si passa al successivo (il .part si riprende solo dallo stesso URL)
+            for index, mirror in enumerate(mirrors):
+                try:
+                    result = self._fetch_from_mirror(mirror, part_path, filename, quiet)
+                    url = mirror
+                    break
+                except (requests.exceptions.RequestException, OSError) as e:
+                    if index == len(mirrors) - 1:
+                        raise
+                    if not quiet:
+                        print(self.colorize(f"⚠️  {filename}: mirror {mirror} non disponibile ({e}), passo al successivo", "yellow"))
             
-            with open(filepath, 'wb') as file:
-                if TQDM_AVAILABLE and total_size > 0:
-                    with tqdm(
-                        total=total_size, 
-                        unit='B', 
-                        unit_scale=True, 
-                        desc=filename,
-                        ncols=80
-                    ) as pbar:
-                        for chunk in response.iter_content(chunk_size=8192):
-                            if chunk:
-                                file.write(chunk)
-                                pbar.update(len(chunk))
-                else:
-                    # Fallback senza tqdm
-                    downloaded = 0
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            file.write(chunk)
-                            downloaded += len(chunk)
-                            if total_size > 0:
-                                percent = (downloaded / total_size) * 100
-                                bar_length = 40
-                                filled_length = int(bar_length * downloaded // total_size)
-                                bar = '█' * filled_length + '-' * (bar_length - filled_length)
-                                print(f'\r[{bar}] {percent:.1f}%', end='', flush=True)
-                    
-                    print()  # New line after progress
+            if result['not_modified']:
+                self._cache_store(url, result['sha256'], meta=result, target=filepath)
+                if not quiet:
+                    print(self.colorize(f"♻️  {filename} dalla cache (non modificato)", "green"))
+            else:
+                self._cache_store(url, result['sha256'], part_path, result, target=filepath)
+                if not quiet:
+                    print(self.colorize(f"✅ Download completato: {filename}", "green"))
             
-            print(self.colorize(f"✅ Download completato: {filename}", "green"))
+            self._write_digests(filepath, result.get('digests') or {'sha256': result['sha256']})
             
-            # Estrazione automatica per file zip
-            if filepath.suffix.lower() == '.zip':
-                self.extract_zip(filepath)
+            # Estrazione automatica per file zip (la pipeline la esegue in uno stadio separato)
+            # Il timbro di estrazione rende gratuita la ripetizione su archivi invariati
+            if extract and filepath.suffix.lower() == '.zip':
+                if not self.extract_zip(filepath, quiet, self.extract_members(filepath.stem)):
+                    self.download_errors[filename] = "estrazione fallita"
+                    return False
                 
             return True
             
         except requests.exceptions.RequestException as e:
-            print(self.colorize(f"❌ Errore nel download di {filename}: {e}", "red"))
+            self.download_errors[filename] = str(e)
+            if not quiet:
+                print(self.colorize(f"❌ Errore nel download di {filename}: {e}", "red"))
             return False
         except Exception as e:
-            print(self.colorize(f"❌ Errore imprevisto: {e}", "red"))
+            self.download_errors[filename] = str(e)
+            if not quiet:
+                print(self.colorize(f"❌ Errore imprevisto: {e}", "red"))
             return False
 
+    def _fetch_from_mirror(self, url, part_path, filename, quiet):
+        """Scarica da un singolo mirror con revalidazione della cache e ripresa"""
+        # Revalidazione condizionale della copia in cache (304 = nessun trasferimento)
+        cached = None if part_path.exists() else self._cache_lookup(url)
+        validators = {}
+        if cached:
+            if cached.get('etag'):
+                validators['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                validators['If-Modified-Since'] = cached['last_modified']
+        
+        attempts = 3
+        attempt = 1
+        retried_304 = False
+        while True:
+            try:
+                result = self._download_to_part(url, part_path, filename, quiet, validators)
+            except (requests.exceptions.ConnectionError,
+                    requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout) as e:
+                if attempt == attempts:
+                    raise
+                if not quiet:
+                    print(self.colorize(f"⚠️  {filename}: connessione interrotta ({e}), ripresa {attempt}/{attempts - 1}...", "yellow"))
+                time.sleep(attempt)
+                attempt += 1
+                continue
+            
+            if result['not_modified'] and (cached is None or self._cache_lookup(url) is None):
+                # 304 senza copia in cache utilizzabile (indice perso, oggetto rimosso, risposta non
+                # richiesta): è un cache miss, si ripete una volta senza intestazioni condizionali
+                if retried_304:
+                    raise requests.exceptions.HTTPError("risposta 304 senza una copia in cache da riusare")
+                retried_304 = True
+                cached = None
+                validators = {}
+                continue
+            break
+        
+        if result['not_modified']:
+            result['sha256'] = cached['sha256']
+            with self._cache_lock:
+                cached_object = self._load_cache_index()["objects"].get(cached['sha256'], {})
+            result['digests'] = cached_object.get('digests', {})
+        return result
+
+    def get_mirrors(self, name):
+        """Mirror di un artefatto: quelli configurati più i mirror locali/LAN"""
+        configured = self.config["download_mirrors"][name]
+        mirrors = [configured] if isinstance(configured, str) else list(configured)
+        for base in self.config.get("local_mirrors", []):
+            mirrors.append(f"{base.rstrip('/')}/{name}.zip")
+        return mirrors
+
+    def rank_mirrors(self, mirrors, filename="", quiet=False):
+        """Ordina i mirror per latenza e throughput misurati con una richiesta di prova"""
+        timeout = self.config.get("mirror_probe_timeout", 3)
+        executor = ThreadPoolExecutor(max_workers=len(mirrors))
+        futures = {executor.submit(self._probe_mirror, mirror, timeout): mirror for mirror in mirrors}
+        done, _ = wait(futures, timeout=timeout)
+        # Non si attendono i mirror lenti oltre la scadenza della gara
+        executor.shutdown(wait=False)
+        
+        scores = {}
+        for future in done:
+            try:
+                scores[futures[future]] = future.result()
+            except Exception:
+                pass
+        
+        # A parità di misura vale l'ordine configurato; i mirror senza risposta vanno in fondo
+        ranked = sorted(mirrors, key=lambda mirror: (mirror not in scores, scores.get(mirror, 0)))
+        if not quiet and ranked[0] in scores:
+            print(f"🏁 {filename}: mirror scelto {ranked[0]} (stima {scores[ranked[0]] * 1000:.0f} ms)")
+        return ranked
+
+    def _probe_mirror(self, url, timeout):
+        """Misura latenza e throughput di un mirror leggendo i primi 64 KiB"""
+        probe_size = 65536
+        start = time.monotonic()
+        if url.startswith("file://"):
+            with open(self._file_mirror_path(url), 'rb') as f:
+                latency = time.monotonic() - start
+                data = f.read(probe_size)
+        else:
+            headers = {'Range': f'bytes=0-{probe_size - 1}'}
+            response = self.get_probe_session().get(url, stream=True, timeout=(timeout, timeout), headers=headers)
+            with response:
+                response.raise_for_status()
+                latency = time.monotonic() - start
+                data = b''
+                for chunk in response.iter_content(chunk_size=probe_size):
+                    data += chunk
+                    if len(data) >= probe_size:
+                        break
+        
+        transfer_time = max(time.monotonic() - start - latency, 1e-6)
+        throughput = max(len(data), 1) / transfer_time
+        # Tempo stimato per un artefatto tipico da 4 MiB
+        return latency + (4 * 1024 * 1024) / throughput
+
+    def _file_mirror_path(self, url):
+        """Percorso locale di un mirror file://"""
+        # urllib.request è costoso da importare: serve solo per i mirror file://
+        from urllib.request import url2pathname
+        parsed = urlparse(url)
+        path = url2pathname(parsed.path)
+        if parsed.netloc and parsed.netloc != 'localhost':
+            # Percorso di rete (UNC) del file server locale
+            path = f"//{parsed.netloc}{path}"
+        return Path(path)
+
+    def _copy_from_file_mirror(self, url, part_path, validators):
+        """Copia un artefatto da un mirror file:// nel file .part"""
+        source = self._file_mirror_path(url)
+        stat = source.stat()
+        # Validatore equivalente a un ETag: dimensione e mtime del file sorgente
+        etag = f'"{stat.st_size}-{stat.st_mtime_ns}"'
+        if validators and validators.get('If-None-Match') == etag:
+            return {'not_modified': True}
+        
+        hasher = _MultiHasher(self.digest_algorithms())
+        with open(source, 'rb') as src, open(part_path, 'wb') as dst:
+            for block in iter(lambda: src.read(1024 * 1024), b''):
+                dst.write(block)
+                hasher.update(block)
+            dst.flush()
+            os.fsync(dst.fileno())
+        digests = hasher.hexdigests()
+        return {'not_modified': False, 'etag': etag, 'last_modified': None,
+                'sha256': digests['sha256'], 'digests': digests}
+
+    def _download_to_part(self, url, part_path, filename, quiet, validators=None, segmented=True):
+        """Scarica url nel file .part, riprendendo con Range se già presente"""
+        resume_path = part_path.with_name(part_path.name + ".resume")
+        if url.startswith("file://"):
+            part_path.with_name(part_path.name + ".segments").unlink(missing_ok=True)
+            resume_path.unlink(missing_ok=True)
+            return self._copy_from_file_mirror(url, part_path, validators)
+        
+        # Un download segmentato interrotto riprende dai segmenti salvati (stesso URL)
+        state_path = part_path.with_name(part_path.name + ".segments")
+        if state_path.exists() and part_path.exists():
+            state = self._load_resume_state(state_path)
+            if state.get('url') == url and state.get('segments') and self._if_range_validator(state):
+                return self._download_segmented(url, part_path, filename, quiet, state)
+            part_path.unlink()
+        state_path.unlink(missing_ok=True)
+        
+        # Il .part si riprende solo dallo stesso URL e con un validatore per If-Range
+        resume_from = 0
+        resume_state = {}
+        if part_path.exists():
+            resume_state = self._load_resume_state(resume_path)
+            if resume_state.get('url') == url and self._if_range_validator(resume_state):
+                resume_from = part_path.stat().st_size
+            else:
+                part_path.unlink()
+                resume_state = {}
+        
+        if resume_from:
+            # If-Range: se il file remoto è cambiato il server risponde 200 con il file intero
+            headers = {'Range': f'bytes={resume_from}-', 'If-Range': self._if_range_validator(resume_state)}
+        else:
+            headers = dict(validators or {})
+        
+        session = self.get_session()
+        response = session.get(url, stream=True, timeout=self.get_http_timeout(), headers=headers)
+        if response.status_code == 304:
+            response.close()
+            return {'not_modified': True}
+        
+        meta = {
+            'not_modified': False,
+            'etag': response.headers.get('etag'),
+            'last_modified': response.headers.get('last-modified'),
+        }
+        # Tutti i digest si calcolano nel ciclo di scrittura: pronti all'arrivo dell'ultimo blocco
+        hasher = _MultiHasher(self.digest_algorithms())
+        
+        if response.status_code == 416:
+            # Range non soddisfacibile: il .part è già completo oppure non è più valido
+            remote_size = response.headers.get('content-range', '').rpartition('/')[2]
+            response.close()
+            same_etag = meta['etag'] is None or meta['etag'] == resume_state.get('etag')
+            if resume_from and same_etag and remote_size.isdigit() and int(remote_size) == resume_from:
+                meta['etag'] = resume_state.get('etag')
+                meta['last_modified'] = resume_state.get('last_modified')
+                self._hash_file_into(hasher, part_path)
+                meta['digests'] = hasher.hexdigests()
+                meta['sha256'] = meta['digests']['sha256']
+                resume_path.unlink(missing_ok=True)
+                return meta
+            part_path.unlink()
+            resume_from = 0
+            response = session.get(url, stream=True, timeout=self.get_http_timeout())
+            meta['etag'] = response.headers.get('etag')
+            meta['last_modified'] = response.headers.get('last-modified')
+        response.raise_for_status()
+        
+        if resume_from and response.status_code == 206:
+            mode = 'ab'
+            meta['etag'] = meta['etag'] or resume_state.get('etag')
+            meta['last_modified'] = meta['last_modified'] or resume_state.get('last_modified')
+            # I digest devono coprire anche la parte già scaricata
+            self._hash_file_into(hasher, part_path)
+            if not quiet:
+                print(f"↪️  Ripresa di {filename} da {resume_from / (1024*1024):.1f} MB")
+        else:
+            # Il server ha ignorato il Range: si riscrive il file dall'inizio
+            resume_from = 0
+            mode = 'wb'
+        
+        # La dimensione arriva dagli header della GET
+        total_size = int(response.headers.get('content-length', 0) or 0)
+        if total_size:
+            total_size += resume_from
+        downloaded = resume_from
+        
+        # File grandi su server con Accept-Ranges: download segmentato in parallelo
+        min_size = self.config.get("segmented_download_min_mb", 4) * 1024 * 1024
+        segments = self.config.get("download_segments", 4)
+        accept_ranges = response.headers.get('accept-ranges', '').lower() == 'bytes'
+        # Senza un validatore per If-Range i segmenti potrebbero mescolare versioni diverse del file
+        can_segment = segmented and accept_ranges and self._if_range_validator(meta)
+        if not resume_from and can_segment and segments > 1 and total_size >= min_size:
+            response.close()
+            segment_size = -(-total_size // segments)
+            state = {
+                'url': url,
+                'size': total_size,
+                'etag': meta['etag'],
+                'last_modified': meta['last_modified'],
+                'segments': [
+                    {'start': start, 'end': min(start + segment_size, total_size) - 1, 'done': 0}
+                    for start in range(0, total_size, segment_size)
+                ],
+            }
+            resume_path.unlink(missing_ok=True)
+            return self._download_segmented(url, part_path, filename, quiet, state)
+        
+        if mode == 'wb':
+            # Validatori del nuovo contenuto: servono a riprendere il .part in sicurezza
+            _write_json_atomic(resume_path, {
+                'url': url, 'etag': meta['etag'], 'last_modified': meta['last_modified']
+            })
+        
+        with open(part_path, mode) as file:
+            if quiet:
+                for chunk in response.iter_content(chunk_size=8192):
+                    if chunk:
+                        file.write(chunk)
+                        hasher.update(chunk)
+                        downloaded += len(chunk)
+            elif TQDM_AVAILABLE and total_size > 0:
+                with tqdm(
+                    total=total_size, 
+                    initial=resume_from,
+                    unit='B', 
+                    unit_scale=True, 
+                    desc=filename,
+                    ncols=80
+                ) as pbar:
+                    for chunk in response.iter_content(chunk_size=8192):
+                        if chunk:
+                            file.write(chunk)
+                            hasher.update(chunk)
+                            downloaded += len(chunk)
+                            pbar.update(len(chunk))
+            else:
+                # Fallback senza tqdm
+                for chunk in response.iter_content(chunk_size=8192):
+                    if chunk:
+                        file.write(chunk)
+                        hasher.update(chunk)
+                        downloaded += len(chunk)
+                        if total_size > 0:
+                            percent = (downloaded / total_size) * 100
+                            bar_length = 40
+                            filled_length = int(bar_length * downloaded // total_size)
+                            bar = '█' * filled_length + '-' * (bar_length - filled_length)
+                            print(f'\r[{bar}] {percent:.1f}%', end='', flush=True)
+                
+                print()  # New line after progress
+            
+            # Dati su disco prima della rinomina atomica
+            file.flush()
+            os.fsync(file.fileno())
+        
+        if total_size and downloaded < total_size:
+            raise requests.exceptions.ChunkedEncodingError(
+                f"trasferimento incompleto ({downloaded}/{total_size} byte)"
+            )
+        
+        resume_path.unlink(missing_ok=True)
+        meta['digests'] = hasher.hexdigests()
+        meta['sha256'] = meta['digests']['sha256']
+        return meta
+
+    def _load_resume_state(self, resume_path):
+        """Legge URL e validatori salvati accanto al .part (vuoto se assenti o illeggibili)"""
+        return _read_json(resume_path, {})
+
+    def _if_range_validator(self, state):
+        """Validatore utilizzabile in If-Range: ETag forte, altrimenti Last-Modified"""
+        etag = state.get('etag')
+        if etag and not etag.startswith('W/'):
+            return etag
+        return state.get('last_modified')
+
+    def _download_segmented(self, url, part_path, filename, quiet, state):
+        """Scarica i segmenti (range di byte) in parallelo in un file preallocato"""
+        state_path = part_path.with_name(part_path.name + ".segments")
+        total_size = state['size']
+        
+        if not part_path.exists() or part_path.stat().st_size != total_size:
+            # Preallocazione: ogni segmento scrive al proprio offset
+            with open(part_path, 'wb') as file:
+                if hasattr(os, 'posix_fallocate'):
+                    os.posix_fallocate(file.fileno(), 0, total_size)
+                else:
+                    file.truncate(total_size)
+            for segment in state['segments']:
+                segment['done'] = 0
+        
+        _write_json_atomic(state_path, state)
+        
+        done = sum(segment['done'] for segment in state['segments'])
+        progress_lock = threading.Lock()
+        pbar = None
+        if not quiet:
+            print(f"🧩 {filename}: download segmentato in {len(state['segments'])} parti")
+            if TQDM_AVAILABLE:
+                pbar = tqdm(total=total_size, initial=done, unit='B', unit_scale=True, desc=filename, ncols=80)
+        
+        # I digest seguono il prefisso contiguo: alla fine non serve rileggere il file
+        prefix = _PrefixHasher(_MultiHasher(self.digest_algorithms()), part_path, state['segments'])
+        
+        def update(offset, chunk):
+            prefix.update(offset, chunk)
+            if pbar is not None:
+                with progress_lock:
+                    pbar.update(len(chunk))
+        
+        if_range = self._if_range_validator(state)
+        abort = threading.Event()
+        try:
+            with ThreadPoolExecutor(max_workers=len(state['segments'])) as executor:
+                futures = [
+                    executor.submit(self._download_segment, url, part_path, segment, if_range, update, abort)
+                    for segment in state['segments']
+                ]
+                try:
+                    for future in as_completed(futures):
+                        future.result()
+                except BaseException:
+                    # Gli altri segmenti si fermano al blocco successivo
+                    abort.set()
+                    raise
+        except _RangeNotHonored as e:
+            # Range ignorato o file remoto cambiato (If-Range non soddisfatto): flusso singolo da zero
+            state_path.unlink(missing_ok=True)
+            part_path.unlink(missing_ok=True)
+            if pbar is not None:
+                pbar.close()
+                pbar = None
+            if not quiet:
+                print(self.colorize(f"⚠️  {filename}: {e}, download in un unico flusso", "yellow"))
+            return self._download_to_part(url, part_path, filename, quiet, segmented=False)
+        except Exception:
+            _write_json_atomic(state_path, state)
+            raise
+        finally:
+            if pbar is not None:
+                pbar.close()
+        
+        with open(part_path, 'rb+') as file:
+            os.fsync(file.fileno())
+        state_path.unlink()
+        
+        hasher = prefix.hasher
+        if prefix.finish() != total_size:
+            # Non dovrebbe accadere: si ripiega sulla lettura completa del file
+            hasher = _MultiHasher(self.digest_algorithms())
+            self._hash_file_into(hasher, part_path)
+        digests = hasher.hexdigests()
+        return {
+            'not_modified': False,
+            'etag': state.get('etag'),
+            'last_modified': state.get('last_modified'),
+            'sha256': digests['sha256'],
+            'digests': digests,
+        }
+
+    def _download_segment(self, url, part_path, segment, if_range, update, abort):
+        """Scarica un singolo range di byte e lo scrive al suo offset"""
+        start = segment['start'] + segment['done']
+        if start > segment['end'] or abort.is_set():
+            return
+        
+        headers = {'Range': f"bytes={start}-{segment['end']}", 'If-Range': if_range}
+        
+        response = self.get_session().get(url, stream=True, timeout=self.get_http_timeout(), headers=headers)
+        with response:
+            if response.status_code == 200:
+                raise _RangeNotHonored(f"range non supportato o file remoto cambiato (HTTP {response.status_code})")
+            response.raise_for_status()
+            if response.status_code != 206:
+                raise requests.exceptions.HTTPError(
+                    f"risposta inattesa a una richiesta Range (HTTP {response.status_code})",
+                    response=response
+                )
+            # Senza buffer: i byte contati in 'done' sono già leggibili dagli altri descrittori
+            with open(part_path, 'rb+', buffering=0) as file:
+                file.seek(start)
+                for chunk in response.iter_content(chunk_size=65536):
+                    if abort.is_set():
+                        return
+                    if chunk:
+                        offset = segment['start'] + segment['done']
+                        view = memoryview(chunk)
+                        while view:
+                            view = view[file.write(view):]
+                        segment['done'] += len(chunk)
+                        update(offset, chunk)
+        
+        if segment['start'] + segment['done'] <= segment['end']:
+            raise requests.exceptions.ChunkedEncodingError(
+                f"segmento incompleto ({segment['start']}-{segment['end']})"
+            )
+
+    def _hash_file_into(self, hasher, filepath):
+        """Aggiorna un hasher leggendo il file a blocchi"""
+        with open(filepath, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                hasher.update(block)
+
+    def _load_hash_cache(self):
+        """Carica (una volta) la cache persistente degli hash dei file"""
+        if self._hash_cache is None:
+            self._hash_cache = _read_json(self.cache_dir / "hashes.json", {})
+        return self._hash_cache
+
+    def _save_hash_cache(self):
+        """Salva la cache degli hash in modo atomico"""
+        _write_json_atomic(self.cache_dir / "hashes.json", self._hash_cache)
+
+    def digest_algorithms(self):
+        """Algoritmi calcolati durante i download (SHA-256 sempre incluso, serve alla cache)"""
+        algorithms = [a for a in self.config.get("download_digests", ["md5", "sha1", "sha256"]) if a in hashlib.algorithms_available]
+        return algorithms if "sha256" in algorithms else algorithms + ["sha256"]
+
+    def _write_digests(self, filepath, digests):
+        """Salva i digest accanto al file (<file>.digests.json) e li registra nella cache degli hash"""
+        stat = filepath.stat()
+        record = {"file": filepath.name, "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "digests": digests}
+        _write_json_atomic(filepath.with_name(filepath.name + ".digests.json"), record)
+        
+        # Il controllo checksum successivo non deve rileggere il file
+        with self._hash_lock:
+            self._load_hash_cache()[str(filepath.resolve())] = {
+                "size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "digests": dict(digests)
+            }
+            self._save_hash_cache()
+
+    def write_digest_manifest(self, directory, pattern="*"):
+        """Digest (MD5/SHA-1/SHA-256 in un passaggio) dei file di una cartella, es. backup NAND o salvataggi"""
+        directory = Path(directory)
+        files = [path for path in sorted(directory.glob(pattern)) if path.is_file() and path.name != "digests.json"]
+        results = self.hash_files(files, self.digest_algorithms())
+        manifest = {
+            path.name: results[path][0] for path in files if not isinstance(results[path], OSError)
+        }
+        _write_json_atomic(directory / "digests.json", manifest)
+        return manifest
+
+    def file_digests(self, filepath, algorithms=("sha256",)):
+        """Digest del file letti a blocchi, riusati dalla cache se (percorso, dimensione, mtime) non cambiano"""
+        key = str(Path(filepath).resolve())
+        stat = os.stat(key)
+        with self._hash_lock:
+            cached = self._load_hash_cache().get(key)
+        if (cached and cached["size"] == stat.st_size and cached["mtime_ns"] == stat.st_mtime_ns
+                and all(algorithm in cached["digests"] for algorithm in algorithms)):
+            return {algorithm: cached["digests"][algorithm] for algorithm in algorithms}, True
+        
+        hasher = _MultiHasher(algorithms)
+        self._hash_file_into(hasher, key)
+        digests = hasher.hexdigests()
+        
+        with self._hash_lock:
+            cache = self._load_hash_cache()
+            previous = cache.get(key)
+            if previous and previous["size"] == stat.st_size and previous["mtime_ns"] == stat.st_mtime_ns:
+                digests = dict(previous["digests"], **digests)
+            cache[key] = {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns, "digests": digests}
+        return {algorithm: digests[algorithm] for algorithm in algorithms}, False
+
+    def hash_files(self, paths, algorithms=("sha256",)):
+        """Digest di più file in parallelo (hashlib rilascia il GIL): {percorso: (digest, da cache)}"""
+        workers = int(self.config.get("hash_workers", 0)) or min(8, os.cpu_count() or 1)
+        results = {}
+        with ThreadPoolExecutor(max_workers=max(1, min(workers, len(paths) or 1))) as executor:
+            futures = {executor.submit(self.file_digests, path, algorithms): path for path in paths}
+            for future in as_completed(futures):
+                try:
+                    results[futures[future]] = future.result()
+                except OSError as e:
+                    results[futures[future]] = e
+        with self._hash_lock:
+            self._save_hash_cache()
+        return results
+
+    def expected_digests(self, filename):
+        """Digest di riferimento: checksum configurati, poi SHA-256 verificato al download"""
+        expected = self.config.get("expected_checksums", {}).get(filename, {})
+        if isinstance(expected, str):
+            # Algoritmo dedotto dalla lunghezza del digest esadecimale
+            expected = {{32: "md5", 40: "sha1", 64: "sha256"}.get(len(expected), "sha256"): expected}
+        expected = {algorithm: digest.lower() for algorithm, digest in expected.items()}
+        
+        # Digest calcolati durante il download e salvati accanto all'artefatto
+        sidecar = _read_json(self.downloads_dir / f"{filename}.digests.json", {})
+        if isinstance(sidecar.get("digests"), dict):
+            for algorithm, digest in sidecar["digests"].items():
+                expected.setdefault(algorithm, digest)
+        
+        name = Path(filename).stem
+        if "sha256" not in expected and name in self.config.get("download_mirrors", {}):
+            with self._cache_lock:
+                urls = self._load_cache_index()["urls"]
+                for url in self.get_mirrors(name):
+                    if url in urls:
+                        expected["sha256"] = urls[url]["sha256"]
+                        break
+        return expected
+
+    def _load_cache_index(self):
+        """Carica (una volta) l'indice della cache download"""
+        if self._cache_index is None:
+            self._cache_index = _read_json(self.cache_dir / "index.json", {})
+            self._cache_index.setdefault("urls", {})
+            self._cache_index.setdefault("objects", {})
+        return self._cache_index
+
+    def _save_cache_index(self):
+        """Salva l'indice della cache in modo atomico"""
+        _write_json_atomic(self.cache_dir / "index.json", self._cache_index)
+
+    def _cache_lookup(self, url):
+        """Restituisce la voce di cache per l'URL se l'oggetto è ancora presente"""
+        with self._cache_lock:
+            entry = self._load_cache_index()["urls"].get(url)
+            if entry and (self.cache_dir / "objects" / entry["sha256"]).exists():
+                return dict(entry)
+        return None
+
+    def _cache_store(self, url, sha256, part_path=None, meta=None, target=None):
+        """Registra il contenuto (indirizzato per SHA-256), lo rende disponibile in target e aggiorna l'accesso LRU"""
+        object_path = self.cache_dir / "objects" / sha256
+        with self._cache_lock:
+            index = self._load_cache_index()
+            if part_path is not None:
+                if object_path.exists():
+                    part_path.unlink()
+                else:
+                    os.replace(part_path, object_path)
+                index["urls"][url] = {
+                    "sha256": sha256,
+                    "etag": meta.get('etag'),
+                    "last_modified": meta.get('last_modified'),
+                }
+            digests = (meta or {}).get('digests') or index["objects"].get(sha256, {}).get("digests", {})
+            index["objects"][sha256] = {
+                "size": object_path.stat().st_size,
+                "last_access": time.time(),
+                "digests": digests,
+            }
+            if target is not None:
+                # Sotto lo stesso lock: un'evizione da un altro download non può rimuovere l'oggetto prima del link
+                self._cache_materialize(object_path, target)
+            self._cache_evict(keep=sha256)
+            self._save_cache_index()
+        return object_path
+
+    def _cache_evict(self, keep=None):
+        """Elimina gli oggetti usati meno di recente oltre il budget cache_max_mb"""
+        index = self._load_cache_index()
+        budget = self.config.get("cache_max_mb", 1024) * 1024 * 1024
+        objects = index["objects"]
+        total = sum(obj["size"] for obj in objects.values())
+        
+        for sha256 in sorted(objects, key=lambda key: objects[key]["last_access"]):
+            if total <= budget:
+                break
+            if sha256 == keep:
+                continue
+            total -= objects.pop(sha256)["size"]
+            (self.cache_dir / "objects" / sha256).unlink(missing_ok=True)
+            for url in [u for u, e in index["urls"].items() if e["sha256"] == sha256]:
+                del index["urls"][url]
+
+    def _cache_materialize(self, object_path, filepath):
+        """Rende disponibile l'oggetto in downloads/ (hard link o copia), True se cambiato"""
+        try:
+            if filepath.exists() and os.path.samefile(object_path, filepath):
+                return False
+        except OSError:
+            pass
+        
+        tmp_path = filepath.with_name(filepath.name + ".tmp")
+        tmp_path.unlink(missing_ok=True)
+        try:
+            os.link(object_path, tmp_path)
+        except OSError:
+            shutil.copy2(object_path, tmp_path)
+        os.replace(tmp_path, filepath)
+        return True
+
     def download_files_menu(self):
         """Menu download file"""
         while True:
@@ -247,18 +1339,23 @@ class ThreeDSModTool:
 
 {self.colorize('Azioni Multiple:', 'yellow')}
 {self.colorize('8.', 'green')} Download Tutto
+{self.colorize('9.', 'green')} Download Tutto + Preparazione SD (pipeline)
+
+{self.colorize('Postazioni Offline:', 'yellow')}
+{self.colorize('10.', 'green')} Esporta Bundle Offline
+{self.colorize('11.', 'green')} Importa Bundle Offline
 {self.colorize('0.', 'red')} Torna al Menu
             """)
             
             choice = input("\nSeleziona opzione: ")
             
             download_actions = {
-                "1": ("boot9strap.zip", self.config["download_mirrors"]["boot9strap"]),
-                "2": ("luma3ds.zip", self.config["download_mirrors"]["luma3ds"]),
-                "3": ("godmode9.zip", self.config["download_mirrors"]["godmode9"]),
-                "4": ("fbi.zip", self.config["download_mirrors"]["fbi"]),
-                "5": ("homebrew_launcher.zip", self.config["download_mirrors"]["homebrew_launcher"]),
-                "6": ("anemone.zip", self.config["download_mirrors"]["anemone"]),
+                "1": ("boot9strap.zip", self.get_mirrors("boot9strap")),
+                "2": ("luma3ds.zip", self.get_mirrors("luma3ds")),
+                "3": ("godmode9.zip", self.get_mirrors("godmode9")),
+                "4": ("fbi.zip", self.get_mirrors("fbi")),
+                "5": ("homebrew_launcher.zip", self.get_mirrors("homebrew_launcher")),
+                "6": ("anemone.zip", self.get_mirrors("anemone")),
                 "7": ("universal_updater.zip", "https://github.com/Universal-Team/Universal-Updater/releases/download/v3.2.3/Universal-Updater.v3.2.3.zip")
             }
             
@@ -273,208 +1370,1524 @@ class ThreeDSModTool:
                 
             elif choice == "8":
                 self.download_all_files()
+            elif choice == "9":
+                if self.ask_sd_card_path():
+                    self.run_pipeline(sd_path=self.sd_card_path)
+                input("\nPremi INVIO per continuare...")
+            elif choice == "10":
+                path = input("Percorso del bundle (INVIO = cartella bundles): ").strip()
+                self.export_bundle(path or None)
+                input("\nPremi INVIO per continuare...")
+            elif choice == "11":
+                path = input("Percorso del bundle da importare: ").strip()
+                if path:
+                    self.import_bundle(path)
+                input("\nPremi INVIO per continuare...")
             elif choice == "0":
                 break
             else:
-                print(self.colorize("❌ Opzione non valida!", "red"))
-                time.sleep(1)
+                print(self.colorize("❌ Opzione non valida!", "red"))
+                time.sleep(1)
+
+    def get_download_list(self):
+        """Elenco (nome file, URL) di tutti gli artefatti configurati"""
+        return [(f"{name}.zip", self.get_mirrors(name)) for name in self.config["download_mirrors"]]
+
+    def download_all_files(self):
+        """Download di tutti i file"""
+        print(self.colorize("🚀 Download di tutti i file...", "cyan"))
+        
+        files_to_download = self.get_download_list()
+        results = self.download_many(files_to_download, extract=False)
+        
+        success_count = sum(1 for status in results.values() if status["ok"])
+        total_count = len(files_to_download)
+        
+        print(self.colorize(f"\n📊 Download completati: {success_count}/{total_count}", 
+                           "green" if success_count == total_count else "yellow"))
+        
+        # Estrazione in blocco di tutti gli archivi scaricati
+        downloaded = [Path(filename).stem for filename, status in results.items() if status["ok"]]
+        if downloaded:
+            print()
+            self.extract_all_archives(downloaded)
+        input("\nPremi INVIO per continuare...")
+
+    def download_many(self, files, max_workers=None, extract=True):
+        """Download concorrente con pool di worker limitato e stato per artefatto"""
+        if max_workers is None:
+            max_workers = self.config.get("max_concurrent_downloads", 6)
+        max_workers = max(1, min(int(max_workers), len(files) or 1))
+        
+        print(f"⚡ Download simultanei: {max_workers}")
+        start = time.monotonic()
+        results = {}
+        
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(self._download_job, url, filename, extract): filename
+                for filename, url in files
+            }
+            for future in as_completed(futures):
+                filename = futures[future]
+                status = future.result()
+                results[filename] = status
+                if status["ok"]:
+                    size = status["size"] / (1024*1024)
+                    print(f"   📦 {filename}: {size:.1f} MB in {status['elapsed']:.1f}s")
+                else:
+                    error = self.download_errors.get(filename, "errore sconosciuto")
+                    print(self.colorize(f"   ❌ {filename}: fallito dopo {status['elapsed']:.1f}s ({error})", "red"))
+        
+        elapsed = time.monotonic() - start
+        total_size = sum(status["size"] for status in results.values()) / (1024*1024)
+        print(f"⏱️  Tempo totale: {elapsed:.1f}s ({total_size:.1f} MB)")
+        return results
+
+    def _download_job(self, url, filename, extract=True):
+        """Esegue un singolo download dentro il pool e ne misura l'esito"""
+        start = time.monotonic()
+        ok = self.download_with_progress(url, filename, quiet=True, extract=extract)
+        filepath = self.downloads_dir / filename
+        size = filepath.stat().st_size if ok and filepath.exists() else 0
+        return {"ok": ok, "size": size, "elapsed": time.monotonic() - start}
+
+    def run_pipeline(self, names=None, sd_path=None):
+        """Pipeline download → estrazione → copia su SD con stadi sovrapposti"""
+        if names is None:
+            names = list(self.config["download_mirrors"])
+        print(self.colorize("🚀 Pipeline download → estrazione → SD...", "cyan"))
+        
+        if sd_path is not None:
+            self.create_sd_structure(sd_path, verbose=False)
+        
+        # Ogni stadio ha la propria concorrenza: rete, CPU e I/O della SD si sovrappongono
+        download_slots = threading.BoundedSemaphore(self.config.get("max_concurrent_downloads", 6))
+        extract_slots = threading.BoundedSemaphore(self.config.get("pipeline_extract_workers", 2))
+        stage_slots = threading.BoundedSemaphore(self.config.get("pipeline_sd_workers", 1))
+        start = time.monotonic()
+        
+        def run_stage(status, stage, slots, action):
+            with slots:
+                stage_start = time.monotonic()
+                result = action()
+                status[stage] = time.monotonic() - stage_start
+                return result
+        
+        def artifact_flow(name):
+            filename = f"{name}.zip"
+            status = {"ok": False, "copied": 0}
+            if not run_stage(status, "download", download_slots,
+                             lambda: self.download_with_progress(self.get_mirrors(name), filename, quiet=True, extract=False)):
+                status["error"] = self.download_errors.get(filename, "download fallito")
+                return status
+            stage = sd_path is not None and name in SD_PAYLOADS
+            try:
+                # In streaming la SD si scrive direttamente dallo ZIP, prima dell'estrazione
+                if stage and self.config.get("stream_from_zip", True):
+                    status["copied"] = len(run_stage(status, "stage", stage_slots,
+                                                     lambda: self.stage_artifact(name, sd_path)))
+                    stage = False
+                if not run_stage(status, "extract", extract_slots,
+                                 lambda: self.extract_zip(self.downloads_dir / filename, True, self.extract_members(name))):
+                    status["error"] = "estrazione fallita"
+                    return status
+                if stage:
+                    status["copied"] = len(run_stage(status, "stage", stage_slots,
+                                                     lambda: self.stage_artifact(name, sd_path)))
+            except OSError as e:
+                status["error"] = str(e)
+                return status
+            status["ok"] = True
+            status["done_at"] = time.monotonic() - start
+            return status
+        
+        results = {}
+        with ThreadPoolExecutor(max_workers=max(1, len(names))) as executor:
+            futures = {executor.submit(artifact_flow, name): name for name in names}
+            for future in as_completed(futures):
+                name = futures[future]
+                status = future.result()
+                results[name] = status
+                if status["ok"]:
+                    timings = " → ".join(
+                        f"{stage} {status[stage]:.1f}s" for stage in ("download", "stage", "extract") if stage in status
+                    )
+                    copied = f", {status['copied']} file su SD" if status["copied"] else ""
+                    print(f"   ✅ {name}: {timings}{copied}")
+                else:
+                    print(self.colorize(f"   ❌ {name}: {status['error']}", "red"))
+        
+        ok_count = sum(1 for status in results.values() if status["ok"])
+        print(self.colorize(f"\n📊 Pipeline completata: {ok_count}/{len(names)} in {time.monotonic() - start:.1f}s",
+                            "green" if ok_count == len(names) else "yellow"))
+        return results
+
+    def export_bundle(self, bundle_path=None):
+        """Esporta artefatti e cartelle estratte in un unico bundle con manifest"""
+        print(self.colorize("📦 Esportazione bundle offline...", "cyan"))
+        
+        entries = []
+        missing = []
+        for name in self.config["download_mirrors"]:
+            archive = self.downloads_dir / f"{name}.zip"
+            if not archive.exists():
+                missing.append(archive.name)
+                continue
+            entries.append(archive)
+            tree = self.downloads_dir / name
+            if tree.is_dir():
+                entries.extend(sorted(path for path in tree.rglob('*') if path.is_file()))
+        
+        if missing:
+            print(self.colorize(f"⚠️  Non inclusi (mancanti): {', '.join(missing)}", "yellow"))
+        if not entries:
+            print(self.colorize("❌ Nessun artefatto da esportare. Esegui prima i download.", "red"))
+            return None
+        
+        if bundle_path is None:
+            bundles_dir = self.base_dir / "bundles"
+            bundles_dir.mkdir(exist_ok=True)
+            bundle_path = bundles_dir / f"ms17mod_bundle_{datetime.now().strftime('%Y%m%d_%H%M%S')}.tar"
+        bundle_path = Path(bundle_path)
+        tmp_path = bundle_path.with_name(bundle_path.name + ".part")
+        
+        manifest = {
+            "tool_version": self.version,
+            "created": datetime.now().isoformat(timespec='seconds'),
+            "artifacts": {},
+            "files": {}
+        }
+        
+        start = time.monotonic()
+        try:
+            # TAR non compresso: gli zip sono già compressi e la lettura resta sequenziale
+            with tarfile.open(tmp_path, 'w', format=tarfile.PAX_FORMAT) as tar:
+                for path in entries:
+                    arcname = path.relative_to(self.downloads_dir).as_posix()
+                    info = tar.gettarinfo(str(path), arcname=arcname)
+                    with open(path, 'rb') as f:
+                        reader = _HashingReader(f)
+                        tar.addfile(info, reader)
+                    manifest["files"][arcname] = {"size": info.size, "sha256": reader.hasher.hexdigest()}
+                
+                for name, mirrors in self.config["download_mirrors"].items():
+                    archive = f"{name}.zip"
+                    if archive in manifest["files"]:
+                        manifest["artifacts"][name] = {
+                            "archive": archive,
+                            "sha256": manifest["files"][archive]["sha256"],
+                            "extracted": (self.downloads_dir / name).is_dir(),
+                            "mirrors": mirrors
+                        }
+                
+                # Il manifest va in coda: l'importazione verifica in un solo passaggio
+                data = json.dumps(manifest, indent=4).encode('utf-8')
+                info = tarfile.TarInfo("manifest.json")
+                info.size = len(data)
+                info.mtime = int(time.time())
+                tar.addfile(info, io.BytesIO(data))
+            os.replace(tmp_path, bundle_path)
+        except (OSError, tarfile.TarError) as e:
+            tmp_path.unlink(missing_ok=True)
+            print(self.colorize(f"❌ Errore durante l'esportazione: {e}", "red"))
+            return None
+        
+        size = bundle_path.stat().st_size / (1024*1024)
+        elapsed = time.monotonic() - start
+        print(self.colorize(f"✅ Bundle creato: {bundle_path}", "green"))
+        print(f"   {len(manifest['artifacts'])} artefatti, {len(manifest['files'])} file, {size:.1f} MB in {elapsed:.1f}s")
+        return bundle_path
+
+    def import_bundle(self, bundle_path):
+        """Importa un bundle offline in downloads/ con verifica SHA-256 in un solo passaggio"""
+        bundle_path = Path(bundle_path)
+        print(self.colorize(f"📦 Importazione bundle: {bundle_path.name}", "cyan"))
+        
+        if not bundle_path.is_file():
+            print(self.colorize("❌ Bundle non trovato!", "red"))
+            return False
+        
+        tmp_dir = self.downloads_dir / ".import_tmp"
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        tmp_dir.mkdir()
+        
+        start = time.monotonic()
+        hashes = {}
+        manifest = None
+        try:
+            # Lettura in streaming ('r|'): un'unica passata sequenziale sul bundle
+            with tarfile.open(bundle_path, 'r|') as tar:
+                for member in tar:
+                    if member.name == "manifest.json":
+                        manifest = json.load(tar.extractfile(member))
+                        continue
+                    if not member.isfile():
+                        continue
+                    
+                    relative = PurePosixPath(member.name)
+                    if relative.is_absolute() or '..' in relative.parts:
+                        raise ValueError(f"percorso non sicuro nel bundle: {member.name}")
+                    
+                    target = tmp_dir.joinpath(*relative.parts)
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    hasher = hashlib.sha256()
+                    source = tar.extractfile(member)
+                    with open(target, 'wb') as dst:
+                        for block in iter(lambda: source.read(1024 * 1024), b''):
+                            dst.write(block)
+                            hasher.update(block)
+                    os.utime(target, (member.mtime, member.mtime))
+                    hashes[member.name] = hasher.hexdigest()
+            
+            if manifest is None:
+                raise ValueError("manifest.json mancante nel bundle")
+            
+            corrupted = [name for name, info in manifest["files"].items() if hashes.get(name) != info["sha256"]]
+            unexpected = sorted(set(hashes) - set(manifest["files"]))
+            if corrupted or unexpected:
+                raise ValueError(f"verifica fallita: {', '.join(corrupted + unexpected)}")
+            
+            # Verifica superata: sostituzione degli artefatti esistenti
+            for entry in sorted(tmp_dir.iterdir()):
+                target = self.downloads_dir / entry.name
+                if target.is_dir():
+                    shutil.rmtree(target)
+                os.replace(entry, target)
+        
+        except (OSError, ValueError, tarfile.TarError) as e:
+            print(self.colorize(f"❌ Importazione fallita: {e}", "red"))
+            return False
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+        
+        elapsed = time.monotonic() - start
+        for name, artifact in manifest["artifacts"].items():
+            print(f"   ✅ {artifact['archive']} (SHA-256 {artifact['sha256'][:16]}...)")
+        print(self.colorize(f"✅ Importati {len(hashes)} file verificati in {elapsed:.1f}s", "green"))
+        return True
+
+    def extract_members(self, name):
+        """Membri da estrarre per l'artefatto (None = archivio completo)"""
+        if self.config.get("selective_extract", False) and name in SD_PAYLOADS:
+            return [filename for filename, _ in SD_PAYLOADS[name]]
+        return None
+
+    def _archive_sha256(self, filepath, stamp):
+        """SHA-256 dell'archivio, riusando il timbro se dimensione e mtime non cambiano"""
+        stat = filepath.stat()
+        if stamp and stamp.get("size") == stat.st_size and stamp.get("mtime_ns") == stat.st_mtime_ns:
+            return stamp["archive_sha256"]
+        hasher = hashlib.sha256()
+        self._hash_file_into(hasher, filepath)
+        return hasher.hexdigest()
+
+    def _prepare_extraction(self, filepath, members=None):
+        """Confronta l'archivio con il timbro: (già aggiornata, SHA-256 dell'archivio)"""
+        extract_dir = self.downloads_dir / filepath.stem
+        stamp = _read_json(extract_dir / ".extract_stamp.json", {})
+        
+        archive_sha256 = self._archive_sha256(filepath, stamp)
+        if stamp and stamp.get("archive_sha256") == archive_sha256:
+            # Archivio invariato: si salta se il timbro copre i membri richiesti
+            covered = stamp.get("selection") is None or (
+                members is not None and set(members) <= set(stamp["selection"])
+            )
+            if covered and all((extract_dir / name).exists() for name in stamp["members"]):
+                return True, archive_sha256
+        elif stamp:
+            # Archivio cambiato: si rimuove l'estrazione precedente per non mescolare versioni
+            shutil.rmtree(extract_dir)
+        return False, archive_sha256
+
+    def _write_extract_stamp(self, filepath, archive_sha256, members, extracted):
+        """Registra il timbro dell'estrazione appena completata"""
+        stat = filepath.stat()
+        stamp = {
+            "archive_sha256": archive_sha256,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "selection": sorted(members) if members is not None else None,
+            "members": extracted
+        }
+        _write_json_atomic(self.downloads_dir / filepath.stem / ".extract_stamp.json", stamp)
+        
+        # L'indice degli artefatti si ricostruisce una volta per estrazione
+        try:
+            self.update_artifact_index(filepath.stem, archive_sha256)
+        except (OSError, zipfile.BadZipFile):
+            pass
+
+    def extract_zip(self, filepath, quiet=False, members=None):
+        """Estrae file ZIP con gestione errori (incrementale, opzionalmente selettiva)"""
+        try:
+            # Crea directory con nome del file
+            extract_dir = self.downloads_dir / filepath.stem
+            up_to_date, archive_sha256 = self._prepare_extraction(filepath, members)
+            if up_to_date:
+                if not quiet:
+                    print(self.colorize(f"♻️  Estrazione già aggiornata: {extract_dir.name}", "green"))
+                return True
+            
+            with zipfile.ZipFile(filepath, 'r') as zip_ref:
+                extract_dir.mkdir(exist_ok=True)
+                
+                if members is None:
+                    # Estrai tutti i file
+                    zip_ref.extractall(extract_dir)
+                    extracted = [info.filename for info in zip_ref.infolist() if not info.is_dir()]
+                else:
+                    # Solo i membri richiesti (per nome file o percorso completo)
+                    wanted = set(members)
+                    extracted = []
+                    for info in zip_ref.infolist():
+                        if not info.is_dir() and (info.filename in wanted or PurePosixPath(info.filename).name in wanted):
+                            zip_ref.extract(info, extract_dir)
+                            extracted.append(info.filename)
+            
+            self._write_extract_stamp(filepath, archive_sha256, members, extracted)
+                
+            if not quiet:
+                print(self.colorize(f"✅ Estrazione completata in: {extract_dir.name}", "green"))
+            return True
+            
+        except zipfile.BadZipFile:
+            if not quiet:
+                print(self.colorize("❌ File ZIP corrotto o non valido", "red"))
+            return False
+        except Exception as e:
+            if not quiet:
+                print(self.colorize(f"❌ Errore durante l'estrazione: {e}", "red"))
+            return False
+
+    def extract_all_archives(self, names=None):
+        """Estrazione in blocco: archivi e membri grandi distribuiti su un process pool"""
+        if names is None:
+            names = list(self.config["download_mirrors"])
+        print(self.colorize("📦 Estrazione archivi in parallelo...", "cyan"))
+        
+        start = time.monotonic()
+        results = {}
+        plans = {}
+        tasks = []
+        for name in names:
+            filepath = self.downloads_dir / f"{name}.zip"
+            members = self.extract_members(name)
+            try:
+                up_to_date, archive_sha256 = self._prepare_extraction(filepath, members)
+                if up_to_date:
+                    results[name] = {"ok": True, "skipped": True, "failed": [], "elapsed": 0.0, "bytes": 0}
+                    continue
+                with zipfile.ZipFile(filepath, 'r') as zip_ref:
+                    infos = [
+                        info for info in zip_ref.infolist()
+                        if not info.is_dir() and (members is None or info.filename in members
+                                                  or PurePosixPath(info.filename).name in members)
+                    ]
+            except (OSError, zipfile.BadZipFile) as e:
+                results[name] = {"ok": False, "skipped": False, "failed": [str(e)], "elapsed": 0.0, "bytes": 0}
+                continue
+            
+            extract_dir = self.downloads_dir / name
+            extract_dir.mkdir(exist_ok=True)
+            plans[name] = {"filepath": filepath, "sha256": archive_sha256, "members": members,
+                           "pending": 0, "extracted": [], "failed": [], "bytes": 0, "elapsed": 0.0}
+            # I membri grandi hanno un task dedicato, i piccoli viaggiano insieme
+            small = [info.filename for info in infos if info.file_size < LARGE_MEMBER_SIZE]
+            large = [[info.filename] for info in infos if info.file_size >= LARGE_MEMBER_SIZE]
+            for group in ([small] if small else []) + large:
+                tasks.append((name, filepath, extract_dir, group))
+                plans[name]["pending"] += 1
+        
+        if tasks:
+            from concurrent.futures import ProcessPoolExecutor
+            from concurrent.futures.process import BrokenProcessPool
+            workers = self.config.get("extract_workers", 0) or os.cpu_count() or 2
+            try:
+                self._run_extract_tasks(ProcessPoolExecutor(max_workers=workers), tasks, plans, results)
+            except (OSError, NotImplementedError, BrokenProcessPool):
+                # Ambienti senza multiprocessing: si ripiega sui thread
+                for plan in plans.values():
+                    plan.update(pending=0, extracted=[], failed=[], bytes=0, elapsed=0.0)
+                for name, *_ in tasks:
+                    plans[name]["pending"] += 1
+                self._run_extract_tasks(ThreadPoolExecutor(max_workers=workers), tasks, plans, results)
+        
+        for name in names:
+            result = results[name]
+            if result.get("skipped"):
+                print(f"   ♻️  {name}: già aggiornato")
+            elif result["ok"]:
+                size = result["bytes"] / (1024*1024)
+                print(f"   ✅ {name}: {size:.1f} MB in {result['elapsed']:.2f}s")
+            else:
+                print(self.colorize(f"   ❌ {name}: {len(result['failed'])} errori", "red"))
+                for error in result["failed"][:5]:
+                    print(f"      - {error}")
+        
+        ok_count = sum(1 for result in results.values() if result["ok"])
+        print(self.colorize(f"📊 Estrazioni: {ok_count}/{len(names)} in {time.monotonic() - start:.2f}s",
+                            "green" if ok_count == len(names) else "yellow"))
+        return results
+
+    def _run_extract_tasks(self, executor, tasks, plans, results):
+        """Esegue i task di estrazione e aggrega i risultati per archivio"""
+        from concurrent.futures.process import BrokenProcessPool
+        with executor:
+            futures = {
+                executor.submit(_extract_members_worker, filepath, extract_dir, group): name
+                for name, filepath, extract_dir, group in tasks
+            }
+            for future in as_completed(futures):
+                name = futures[future]
+                plan = plans[name]
+                try:
+                    outcome = future.result()
+                except BrokenProcessPool:
+                    raise
+                except Exception as e:
+                    outcome = {"extracted": [], "failed": [str(e)], "bytes": 0, "elapsed": 0.0}
+                plan["extracted"].extend(outcome["extracted"])
+                plan["failed"].extend(outcome["failed"])
+                plan["bytes"] += outcome["bytes"]
+                # Tempo di estrazione dell'archivio: somma dei suoi task, non dall'avvio del lotto
+                plan["elapsed"] += outcome["elapsed"]
+                plan["pending"] -= 1
+                
+                if plan["pending"] == 0:
+                    # Ultimo task dell'archivio: timbro solo se tutti i CRC sono corretti
+                    ok = not plan["failed"]
+                    if ok:
+                        self._write_extract_stamp(plan["filepath"], plan["sha256"], plan["members"], plan["extracted"])
+                    results[name] = {"ok": ok, "skipped": False, "failed": plan["failed"],
+                                     "elapsed": plan["elapsed"], "bytes": plan["bytes"]}
+
+    def artifact_needs_refresh(self, name):
+        """True se l'artefatto manca, non è estratto o non corrisponde all'URL configurato"""
+        archive = self.downloads_dir / f"{name}.zip"
+        if not archive.exists() or not (self.downloads_dir / name).is_dir():
+            return True
+        # Nessuna voce di cache per i mirror attuali: URL cambiato o cache svuotata
+        return not any(self._cache_lookup(mirror) for mirror in self.get_mirrors(name))
+
+    def start_prefetch(self):
+        """Avvia in background il prefetch degli artefatti mancanti o non aggiornati"""
+        if self._prefetch_thread is not None and self._prefetch_thread.is_alive():
+            return
+        self.prefetch_status = {}
+        self._prefetch_thread = threading.Thread(target=self._prefetch_worker, name="prefetch", daemon=True)
+        self._prefetch_thread.start()
+
+    def _prefetch_worker(self):
+        """Scarica ed estrae in thread di lavoro mentre i menu restano utilizzabili"""
+        pending = [
+            (f"{name}.zip", self.get_mirrors(name))
+            for name in self.config["download_mirrors"]
+            if self.artifact_needs_refresh(name)
+        ]
+        # Il dizionario si assegna già completo: i job aggiornano solo i valori, mai le chiavi
+        self.prefetch_status = {filename: "in attesa" for filename, _ in pending}
+        if not pending:
+            return
+        
+        def job(mirrors, filename):
+            self.prefetch_status[filename] = "in corso"
+            ok = self.download_with_progress(mirrors, filename, quiet=True)
+            self.prefetch_status[filename] = "pronto" if ok else "errore"
+        
+        workers = min(self.config.get("max_concurrent_downloads", 6), len(pending))
+        with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="prefetch") as executor:
+            for filename, mirrors in pending:
+                executor.submit(job, mirrors, filename)
+
+    def prefetch_summary(self):
+        """Riga di stato del prefetch per il menu principale"""
+        statuses = list(self.prefetch_status.values())
+        if not statuses:
+            return None
+        ready = statuses.count("pronto")
+        failed = statuses.count("errore")
+        text = f"📡 Prefetch: {ready}/{len(statuses)} pronti"
+        if failed:
+            text += f", {failed} errori"
+        return text
+
+    def wait_for_prefetch(self):
+        """Attende il prefetch in corso prima di usare gli artefatti"""
+        if self._prefetch_thread is not None and self._prefetch_thread.is_alive():
+            print(self.colorize("⏳ Attendo il completamento del prefetch in background...", "yellow"))
+            self._prefetch_thread.join()
+
+    def check_system(self):
+        """Controllo sistema completo"""
+        self.clear_screen()
+        print(self.colorize("🔍 CONTROLLO SISTEMA IN CORSO...", "cyan"))
+        print("\n" + "="*50)
+        
+        deadline = self.config.get("probe_deadline", 5)
+        checks = self.run_probes({
+            "Python Version 3.7+": ("python", lambda: sys.version_info >= (3, 7), deadline),
+            "Sistema Operativo Supportato": ("os", lambda: platform.system() in ["Windows", "Linux", "Darwin"], deadline),
+            "Connessione Internet": ("internet", self.check_internet, deadline),
+            "Spazio su Disco (>500MB)": ("disk", self.check_disk_space, deadline),
+            "Directory Download": ("downloads_dir", self.downloads_dir.exists, deadline),
+            "Dipendenze Installate": ("dependencies", self.check_dependencies, deadline)
+        })
+        all_ok = self.print_probe_results(checks)
+        
+        # Controllo file scaricati
+        print("\n" + self.colorize("📦 FILE SCARICATI:", "yellow"))
+        downloaded_files = list(self.downloads_dir.glob("*.zip"))
+        if downloaded_files:
+            for file in downloaded_files[:5]:  # Mostra solo primi 5 file
+                size = file.stat().st_size / (1024*1024)
+                print(f"📁 {file.name} ({size:.1f} MB)")
+            if len(downloaded_files) > 5:
+                print(f"... e altri {len(downloaded_files) - 5} file")
+        else:
+            print("Nessun file scaricato")
+        
+        print("\n" + "="*50)
+        
+        if all_ok:
+            print(self.colorize("✅ Sistema OK - Puoi procedere con il modding!", "green"))
+        else:
+            print(self.colorize("⚠️  Alcuni controlli hanno falluto. Controlla i requisiti.", "yellow"))
+        
+        input("\nPremi INVIO per continuare...")
+
+    def run_probes(self, probes):
+        """Esegue i controlli in parallelo con una scadenza ciascuno; risultati in cache per probe_cache_ttl"""
+        ttl = self.config.get("probe_cache_ttl", 30)
+        start = time.monotonic()
+        results = {}
+        pending = {}
+        executor = ThreadPoolExecutor(max_workers=max(1, len(probes)))
+        for label, (key, probe, deadline) in probes.items():
+            with self._probe_lock:
+                cached = self._probe_cache.get(key)
+            if cached and start - cached["at"] < ttl:
+                results[label] = dict(cached, cached=True)
+            else:
+                pending[label] = (key, executor.submit(self._timed_probe, probe), deadline)
+        
+        for label, (key, future, deadline) in pending.items():
+            try:
+                ok, elapsed = future.result(timeout=max(0, start + deadline - time.monotonic()))
+                result = {"ok": ok, "elapsed": elapsed, "timed_out": False}
+            except FutureTimeoutError:
+                result = {"ok": False, "elapsed": deadline, "timed_out": True}
+            except Exception:
+                result = {"ok": False, "elapsed": time.monotonic() - start, "timed_out": False}
+            result["at"] = time.monotonic()
+            # Anche un controllo scaduto resta in cache: cambiare schermata non deve ribloccare
+            with self._probe_lock:
+                self._probe_cache[key] = result
+            results[label] = dict(result, cached=False)
+        
+        # I controlli scaduti finiscono in background senza trattenere l'interfaccia
+        executor.shutdown(wait=False)
+        return {label: results[label] for label in probes}
+
+    def _timed_probe(self, probe):
+        """Esegue un controllo misurandone la durata"""
+        start = time.monotonic()
+        ok = bool(probe())
+        return ok, time.monotonic() - start
+
+    def print_probe_results(self, results):
+        """Stampa l'esito dei controlli e il più lento, True se tutti riusciti"""
+        for check, result in results.items():
+            status = "✅ OK" if result["ok"] else ("⏱️  TIMEOUT" if result["timed_out"] else "❌ FAIL")
+            color = "green" if result["ok"] else "red"
+            print(f"{check}: {self.colorize(status, color)}{' (cache)' if result['cached'] else ''}")
+        
+        measured = {check: result for check, result in results.items() if not result["cached"]}
+        if measured:
+            slowest = max(measured, key=lambda check: measured[check]["elapsed"])
+            if measured[slowest]["elapsed"] >= 1:
+                state = "scaduto dopo" if measured[slowest]["timed_out"] else "completato in"
+                print(self.colorize(f"🐢 Controllo più lento: {slowest} ({state} {measured[slowest]['elapsed']:.1f}s)", "yellow"))
+        return all(result["ok"] for result in results.values())
+
+    def check_internet(self):
+        """Controlla la connessione internet"""
+        try:
+            self.get_probe_session().head("https://github.com", timeout=self.get_http_timeout(10))
+            return True
+        except:
+            return False
+
+    def check_disk_space(self):
+        """Controlla lo spazio su disco"""
+        try:
+            total, used, free = shutil.disk_usage(self.base_dir)
+            return free > 500 * 1024 * 1024  # 500MB minimo
+        except:
+            return False
+
+    def prepare_sd_card(self):
+        """Preparazione SD card completa"""
+        self.clear_screen()
+        print(self.colorize("💾 PREPARAZIONE SCHEDA SD", "cyan"))
+        self.wait_for_prefetch()
+        
+        # Rilevamento SD
+        if not self.ask_sd_card_path():
+            input("\nPremi INVIO per continuare...")
+            return
+        
+        print(f"\nScheda SD rilevata: {self.colorize(str(self.sd_card_path), 'green')}")
+        
+        reason = self.sd_rejection_reason(self.sd_card_path)
+        if reason:
+            print(self.colorize(f"⛔ Scheda scartata: {reason}", "red"))
+            input("\nPremi INVIO per continuare...")
+            return
+        
+        # Impronta rapida: una SD già preparata e aggiornata non va toccata
+        start = time.monotonic()
+        jobs = [job for name in SD_PAYLOADS for job in self.staging_jobs(name, self.sd_card_path)]
+        if self.sd_is_current(self.sd_card_path, jobs):
+            elapsed = (time.monotonic() - start) * 1000
+            print(self.colorize(f"\n⚡ SD già preparata e aggiornata (verifica in {elapsed:.0f} ms)", "green"))
+            input("\nPremi INVIO per continuare...")
+            return
+        
+        # Creazione struttura directory SD
+        print("\nCreazione struttura directory...")
+        if not self.create_sd_structure(self.sd_card_path):
+            print("📁 Struttura già presente")
+        
+        # Copia file essenziali
+        self.copy_essential_files()
+        
+        print(self.colorize("\n✅ SD card preparata con successo!", "green"))
+        input("\nPremi INVIO per continuare...")
+
+    def ask_sd_card_path(self):
+        """Chiede il percorso della SD se non configurato, True se accessibile"""
+        if (not self.sd_card_path or not self.sd_card_path.exists()) and self.config.get("auto_detect_sd", True):
+            cards = self.discover_sd_cards()
+            if len(cards) == 1:
+                self.sd_card_path = cards[0]
+            elif cards:
+                print("SD rilevate:")
+                for i, card in enumerate(cards, 1):
+                    print(f"{self.colorize(f'{i}.', 'green')} {card}")
+                choice = input("\nSeleziona SD: ").strip()
+                if choice.isdigit() and 1 <= int(choice) <= len(cards):
+                    self.sd_card_path = cards[int(choice) - 1]
+        
+        if not self.sd_card_path or not self.sd_card_path.exists():
+            print("Inserisci il percorso della scheda SD:")
+            print("• Windows: E:\\")
+            print("• Linux: /media/username/sd/")
+            print("• Mac: /Volumes/SD/")
+            path = input("\nPercorso SD: ").strip()
+            self.sd_card_path = Path(path)
+            
+            # Salva nel config
+            self.config['sd_card_path'] = str(path)
+            self.save_config()
+        
+        if not self.sd_card_path.exists():
+            print(self.colorize("❌ Percorso non valido! La SD non è accessibile.", "red"))
+            return False
+        return True
+
+    def _mountinfo_entries(self):
+        """Punti di montaggio da /proc/self/mountinfo (solo Linux)"""
+        entries = []
+        try:
+            with open("/proc/self/mountinfo", 'r') as f:
+                lines = f.read().splitlines()
+        except OSError:
+            return entries
+        
+        for line in lines:
+            fields = line.split()
+            if "-" not in fields:
+                continue
+            sep = fields.index("-")
+            # Gli spazi nei percorsi sono codificati in ottale (\040)
+            mount_point = fields[4].encode().decode("unicode_escape").encode("latin-1").decode("utf-8", "replace")
+            entries.append({
+                "dev": fields[2],
+                "mount_point": mount_point,
+                "fstype": fields[sep + 1],
+                "source": fields[sep + 2] if len(fields) > sep + 2 else ""
+            })
+        return entries
+
+    def _is_removable(self, dev):
+        """True se il dispositivo (major:minor) è rimovibile o collegato via USB"""
+        try:
+            device = (Path("/sys/dev/block") / dev).resolve()
+        except OSError:
+            return False
+        if "usb" in " ".join(device.parts):
+            return True
+        for directory in (device, device.parent):
+            try:
+                if (directory / "removable").read_text().strip() == "1":
+                    return True
+            except OSError:
+                continue
+        return False
+
+    def _volume_label(self, source):
+        """Etichetta del volume da /dev/disk/by-label ("" se non disponibile)"""
+        by_label = Path("/dev/disk/by-label")
+        try:
+            for link in by_label.iterdir():
+                if os.path.realpath(link) == os.path.realpath(source):
+                    # udev codifica i caratteri speciali come \xNN
+                    return link.name.encode().decode("unicode_escape")
+        except OSError:
+            pass
+        return ""
+
+    def _looks_like_sd(self, entry):
+        """Euristica SD: FAT su supporto rimovibile, dimensione plausibile, etichetta non di sistema"""
+        if entry["fstype"] not in ("vfat", "msdos") or not self._is_removable(entry["dev"]):
+            return False
+        try:
+            stat = os.statvfs(entry["mount_point"])
+        except OSError:
+            return False
+        if not SD_MIN_SIZE <= stat.f_blocks * stat.f_frsize <= SD_MAX_SIZE:
+            return False
+        return self._volume_label(entry["source"]).upper() not in NON_SD_LABELS
+
+    def discover_sd_cards(self):
+        """Schede SD montate, secondo l'euristica di _looks_like_sd"""
+        return [Path(entry["mount_point"]) for entry in self._mountinfo_entries() if self._looks_like_sd(entry)]
+
+    def watch_sd_cards(self, on_card, stop_event):
+        """Chiama on_card per ogni SD montata dopo l'avvio, guidato dagli eventi di /proc/self/mountinfo"""
+        if not hasattr(select, "poll") or not os.path.exists("/proc/self/mountinfo"):
+            return False
+        
+        known = set(self.discover_sd_cards())
+        with open("/proc/self/mountinfo", 'r') as mountinfo:
+            poller = select.poll()
+            # Il kernel segnala ogni modifica alla tabella dei mount con POLLPRI/POLLERR
+            poller.register(mountinfo.fileno(), select.POLLPRI | select.POLLERR)
+            while not stop_event.is_set():
+                # Il timeout serve solo a controllare la richiesta di arresto
+                if not poller.poll(500):
+                    continue
+                current = set(self.discover_sd_cards())
+                for card in sorted(current - known):
+                    on_card(card)
+                known = current
+        return True
+
+    def auto_provision(self):
+        """Prepara automaticamente ogni SD inserita finché non si preme Ctrl+C"""
+        print(self.colorize("\n🔌 PREPARAZIONE AUTOMATICA ALL'INSERIMENTO", "cyan"))
+        self.wait_for_prefetch()
+        
+        base_jobs = [job for name in SD_PAYLOADS for job in self.staging_jobs(name, Path())]
+        if not base_jobs:
+            print(self.colorize("⚠️  Nessun file essenziale trovato. Esegui prima i download.", "yellow"))
+            return False
+        
+        def provision(card):
+            # Il future non viene mai letto: un'eccezione non gestita qui andrebbe persa in silenzio
+            try:
+                result = self.provision_card(card, base_jobs)
+            except Exception as e:
+                result = {"ok": False, "error": str(e) or type(e).__name__}
+            if result["ok"]:
+                print(self.colorize(f"   ✅ {card}: {result['copied']} copiati, {result['skipped']} già aggiornati "
+                                    f"in {result['elapsed']:.1f}s", "green"))
+            else:
+                print(self.colorize(f"   ❌ {card}: {result['error']}", "red"))
+        
+        stop_event = threading.Event()
+        print("⏳ In attesa di SD (Ctrl+C per terminare)...")
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            try:
+                def on_card(card):
+                    print(f"💾 SD inserita: {card}")
+                    executor.submit(provision, card)
+                if not self.watch_sd_cards(on_card, stop_event):
+                    print(self.colorize("❌ Rilevamento automatico disponibile solo su Linux", "red"))
+                    return False
+            except KeyboardInterrupt:
+                stop_event.set()
+                print(self.colorize("\n⏹️  Rilevamento interrotto, attendo le preparazioni in corso...", "yellow"))
+        return True
+
+    def provision_card(self, sd_path, base_jobs):
+        """Prepara una SD senza interazione: struttura e file essenziali mancanti o cambiati"""
+        start = time.monotonic()
+        result = {"path": sd_path, "ok": False, "bytes": 0, "copied": 0, "skipped": 0}
+        try:
+            if not sd_path.is_dir():
+                raise OSError("percorso non accessibile")
+            reason = self.sd_rejection_reason(sd_path)
+            if reason:
+                raise OSError(f"scheda scartata ({reason})")
+            self.create_sd_structure(sd_path, verbose=False)
+            jobs = [dict(job, target=sd_path / job["target"]) for job in base_jobs]
+            copied, skipped = self.sync_sd(sd_path, jobs)
+            self._raise_copy_errors(jobs)
+            if self.config.get("sd_verify", True):
+                bad = self.verify_sd(sd_path, jobs)
+                if bad:
+                    raise OSError(f"verifica in rilettura fallita: {', '.join(bad)}")
+            sizes = {job["label"]: job["size"] for job in jobs}
+            result.update(ok=True, copied=len(copied), skipped=len(skipped),
+                          bytes=sum(sizes[label] for label in copied))
+        except Exception as e:
+            # Qualunque errore resta confinato alla sua scheda: le altre proseguono e ogni SD ha il suo esito
+            result["error"] = str(e) or type(e).__name__
+        result["elapsed"] = time.monotonic() - start
+        return result
+
+    def batch_provision(self, paths=None):
+        """Prepara più SD in parallelo, un worker per dispositivo"""
+        print(self.colorize("\n💾 PREPARAZIONE MULTI-SD", "cyan"))
+        self.wait_for_prefetch()
+        
+        paths = [Path(path) for path in paths] if paths else self.discover_sd_cards()
+        if not paths:
+            print(self.colorize("❌ Nessuna SD indicata o rilevata", "red"))
+            return False
+        
+        # Artefatti risolti una volta sola e condivisi in sola lettura fra le schede
+        base_jobs = [job for name in SD_PAYLOADS for job in self.staging_jobs(name, Path())]
+        if not base_jobs:
+            print(self.colorize("⚠️  Nessun file essenziale trovato. Esegui prima i download.", "yellow"))
+            return False
+        
+        print(f"🚀 Preparazione di {len(paths)} SD in parallelo...")
+        start = time.monotonic()
+        results = []
+        with ThreadPoolExecutor(max_workers=len(paths)) as executor:
+            futures = [executor.submit(self.provision_card, path, base_jobs) for path in paths]
+            for future in as_completed(futures):
+                result = future.result()
+                results.append(result)
+                if result["ok"]:
+                    mb = result["bytes"] / (1024*1024)
+                    speed = mb / max(result["elapsed"], 1e-6)
+                    print(f"   ✅ {result['path']}: {result['copied']} copiati, {result['skipped']} già aggiornati, "
+                          f"{mb:.1f} MB in {result['elapsed']:.1f}s ({speed:.1f} MB/s)")
+                else:
+                    print(self.colorize(f"   ❌ {result['path']}: {result['error']}", "red"))
+        
+        ok_count = sum(1 for result in results if result["ok"])
+        color = "green" if ok_count == len(results) else "yellow"
+        print(self.colorize(f"\n📊 {ok_count}/{len(results)} SD preparate in {time.monotonic() - start:.1f}s", color))
+        return ok_count == len(results)
+
+    def batch_provision_menu(self):
+        """Menu preparazione multi-SD"""
+        self.clear_screen()
+        print("Percorsi delle SD separati da virgola (INVIO per rilevarle automaticamente):")
+        paths = [path.strip() for path in input("\nPercorsi: ").split(",") if path.strip()]
+        self.batch_provision(paths)
+        input("\nPremi INVIO per continuare...")
+
+    def create_sd_structure(self, sd_path, verbose=True):
+        """Crea le directory mancanti della struttura SD, restituisce quelle create"""
+        created = []
+        for directory in SD_STRUCTURE:
+            dir_path = sd_path / directory
+            if dir_path.is_dir():
+                continue
+            dir_path.mkdir(parents=True, exist_ok=True)
+            created.append(directory)
+            if verbose:
+                print(f"📁 {directory}")
+        return created
+
+    def _load_artifact_index(self):
+        """Carica (una volta) l'indice persistente degli artefatti"""
+        if self._artifact_index is None:
+            self._artifact_index = _read_json(self.downloads_dir / ".artifact_index.json", {})
+        return self._artifact_index
+
+    def _save_artifact_index(self):
+        """Salva l'indice degli artefatti in modo atomico"""
+        _write_json_atomic(self.downloads_dir / ".artifact_index.json", self._artifact_index)
+
+    def update_artifact_index(self, name, archive_sha256=None):
+        """Indicizza i payload SD di un artefatto: membro ZIP, percorso, dimensione e hash"""
+        archive = self.downloads_dir / f"{name}.zip"
+        stat = archive.stat()
+        if archive_sha256 is None:
+            archive_sha256 = self._archive_sha256(archive, None)
+        
+        entry = {
+            "archive": {
+                "file": archive.name,
+                "size": stat.st_size,
+                "mtime_ns": stat.st_mtime_ns,
+                "sha256": archive_sha256
+            },
+            "payloads": {},
+            "missing": []
+        }
+        
+        # L'estrazione vale come sorgente solo se il timbro è di questo stesso archivio
+        stamp = _read_json(self.downloads_dir / name / ".extract_stamp.json", {})
+        stamped = set(stamp["members"]) if stamp and stamp.get("archive_sha256") == archive_sha256 else set()
+        
+        specs = SD_PAYLOADS.get(name, []) + BOOT9STRAP_PAYLOADS.get(name, [])
+        with zipfile.ZipFile(archive, 'r') as zip_ref:
+            for filename, destination in specs:
+                info = self._find_zip_member(zip_ref, filename)
+                if info is None:
+                    entry["missing"].append(filename)
+                    continue
+                
+                hasher = hashlib.sha256()
+                extracted = self.downloads_dir / name / info.filename
+                if info.filename in stamped and extracted.is_file() and extracted.stat().st_size == info.file_size:
+                    self._hash_file_into(hasher, extracted)
+                    path = extracted.relative_to(self.downloads_dir).as_posix()
+                else:
+                    with zip_ref.open(info) as member:
+                        for block in iter(lambda: member.read(SD_COPY_BLOCK), b''):
+                            hasher.update(block)
+                    path = None
+                
+                entry["payloads"][filename] = {
+                    "member": info.filename,
+                    "path": path,
+                    "destination": destination,
+                    "size": info.file_size,
+                    "crc": info.CRC,
+                    "sha256": hasher.hexdigest()
+                }
+        
+        with self._index_lock:
+            self._load_artifact_index()[name] = entry
+            self._save_artifact_index()
+        return entry
+
+    def get_artifact_entry(self, name):
+        """Voce dell'indice per l'artefatto, ricostruita solo se l'archivio è cambiato"""
+        archive = self.downloads_dir / f"{name}.zip"
+        try:
+            stat = archive.stat()
+        except OSError:
+            return None
+        
+        with self._index_lock:
+            entry = self._load_artifact_index().get(name)
+        if entry and entry["archive"]["size"] == stat.st_size and entry["archive"]["mtime_ns"] == stat.st_mtime_ns:
+            return entry
+        try:
+            return self.update_artifact_index(name)
+        except (OSError, zipfile.BadZipFile):
+            return None
+
+    def staging_jobs(self, name, sd_path, payloads=SD_PAYLOADS):
+        """Lavori di copia sulla SD per l'artefatto, risolti tramite l'indice degli artefatti"""
+        jobs = []
+        entry = self.get_artifact_entry(name)
+        if entry is None:
+            return jobs
+        
+        for filename, destination in payloads.get(name, []):
+            payload = entry["payloads"].get(filename)
+            if payload is None:
+                continue
+            source = self.downloads_dir / payload["path"] if payload["path"] else None
+            if self.config.get("stream_from_zip", True) or source is None or not source.is_file():
+                # Streaming dallo ZIP: lookup diretto del membro indicizzato
+                source = None
+            jobs.append({
+                "label": (filename, destination),
+                "source": source,
+                "archive": self.downloads_dir / entry["archive"]["file"],
+                "member": payload["member"],
+                "target": sd_path / destination / filename,
+                "size": payload["size"],
+                "sha256": payload["sha256"]
+            })
+        return jobs
+
+    def stage_artifact(self, name, sd_path, payloads=SD_PAYLOADS):
+        """Copia sulla SD i file dell'artefatto mancanti o cambiati"""
+        jobs = self.staging_jobs(name, sd_path, payloads)
+        copied, _ = self.sync_sd(sd_path, jobs)
+        self._raise_copy_errors(jobs)
+        return copied
+
+    def _raise_copy_errors(self, jobs):
+        """Solleva OSError con l'elenco dei file che la copia sulla SD non ha scritto"""
+        failed = [f"{job['label'][0]} ({job['error']})" for job in jobs if "error" in job]
+        if failed:
+            raise OSError(f"copia fallita: {', '.join(failed)}")
+
+    def _report_copy_errors(self, jobs):
+        """Stampa i file non copiati sulla SD; True se non ce ne sono"""
+        failed = [job for job in jobs if "error" in job]
+        for job in failed:
+            print(self.colorize(f"❌ {job['label'][0]}: {job['error']}", "red"))
+        return not failed
+
+    def load_sd_manifest(self, sd_path):
+        """Manifest dei file posizionati dal tool sulla SD (vuoto se assente o illeggibile)"""
+        manifest = _read_json(sd_path / SD_MANIFEST, {})
+        return manifest if isinstance(manifest.get("files"), dict) else {"files": {}}
+
+    def _save_sd_manifest(self, sd_path, manifest):
+        """Salva il manifest sulla SD in modo atomico"""
+        _write_json_atomic(sd_path / SD_MANIFEST, manifest)
+
+    def sd_fingerprint(self, sd_path, files):
+        """Impronta rapida: dimensione, mtime e pochi campioni di ogni file del manifest"""
+        hasher = hashlib.sha256()
+        for rel_path in sorted(files):
+            hasher.update(rel_path.encode())
+            try:
+                with open(sd_path / rel_path, 'rb') as f:
+                    stat = os.fstat(f.fileno())
+                    hasher.update(f"{stat.st_size}:{stat.st_mtime_ns}".encode())
+                    for offset in sorted({0, stat.st_size // 2, max(0, stat.st_size - SD_SAMPLE_SIZE)}):
+                        f.seek(offset)
+                        hasher.update(f.read(SD_SAMPLE_SIZE))
+            except OSError:
+                hasher.update(b"missing")
+        return hasher.hexdigest()
+
+    def sd_is_current(self, sd_path, jobs):
+        """True se il manifest copre tutti i lavori con gli stessi hash e l'impronta coincide"""
+        manifest = self.load_sd_manifest(sd_path)
+        files = manifest["files"]
+        if not jobs or not files or manifest.get("fingerprint") != self.sd_fingerprint(sd_path, files):
+            return False
+        for job in jobs:
+            entry = files.get(job["target"].relative_to(sd_path).as_posix())
+            if entry is None or entry["sha256"] != job["sha256"]:
+                return False
+        return True
+
+    def sync_sd(self, sd_path, jobs, quiet=True):
+        """Scrive solo i file mancanti o cambiati rispetto al manifest, poi lo aggiorna"""
+        with self._manifest_lock:
+            files = self.load_sd_manifest(sd_path)["files"]
+        
+        delta = []
+        skipped = []
+        for job in jobs:
+            entry = files.get(job["target"].relative_to(sd_path).as_posix())
+            try:
+                stat = job["target"].stat()
+            except OSError:
+                stat = None
+            if (entry and stat and entry["sha256"] == job["sha256"]
+                    and entry["size"] == stat.st_size and entry["mtime_ns"] == stat.st_mtime_ns):
+                skipped.append(job["label"])
+            else:
+                delta.append(job)
+        
+        copied = self.copy_to_sd(delta, quiet)
+        written = [job for job in delta if "error" not in job]
+        if written:
+            with self._manifest_lock:
+                manifest = self.load_sd_manifest(sd_path)
+                for job in written:
+                    stat = job["target"].stat()
+                    manifest["files"][job["target"].relative_to(sd_path).as_posix()] = {
+                        "size": stat.st_size,
+                        "mtime_ns": stat.st_mtime_ns,
+                        "sha256": job["sha256"]
+                    }
+                manifest["updated"] = datetime.now().isoformat()
+                manifest["fingerprint"] = self.sd_fingerprint(sd_path, manifest["files"])
+                self._save_sd_manifest(sd_path, manifest)
+        return copied, skipped
 
-    def download_all_files(self):
-        """Download di tutti i file"""
-        print(self.colorize("🚀 Download di tutti i file...", "cyan"))
+    def copy_to_sd(self, jobs, quiet=True):
+        """Motore di copia sulla SD: file grandi in sequenza, piccoli in parallelo, un solo flush per lotto
+
+        I file non copiati restano fuori dal risultato, con il motivo in job["error"].
+        """
+        if not jobs:
+            return []
         
-        files_to_download = [
-            ("boot9strap.zip", self.config["download_mirrors"]["boot9strap"]),
-            ("luma3ds.zip", self.config["download_mirrors"]["luma3ds"]),
-            ("godmode9.zip", self.config["download_mirrors"]["godmode9"]),
-            ("fbi.zip", self.config["download_mirrors"]["fbi"]),
-            ("homebrew_launcher.zip", self.config["download_mirrors"]["homebrew_launcher"]),
-            ("anemone.zip", self.config["download_mirrors"]["anemone"])
-        ]
+        block_size = max(64, int(self.config.get("sd_copy_block_kb", 4096))) * 1024
+        small_limit = int(self.config.get("sd_small_file_kb", 1024)) * 1024
+        total_size = sum(job["size"] for job in jobs)
         
-        success_count = 0
-        total_count = len(files_to_download)
+        pbar = None
+        if not quiet and TQDM_AVAILABLE:
+            pbar = tqdm(total=total_size, unit='B', unit_scale=True, desc="SD", ncols=80)
+        progress_lock = threading.Lock()
+        written = [0]
         
-        for filename, url in files_to_download:
-            if self.download_with_progress(url, filename):
-                success_count += 1
-            time.sleep(1)  # Pausa tra i download
+        def progress(count):
+            with progress_lock:
+                written[0] += count
+                if pbar:
+                    pbar.update(count)
         
-        print(self.colorize(f"\n📊 Download completati: {success_count}/{total_count}", 
-                           "green" if success_count == total_count else "yellow"))
-        input("\nPremi INVIO per continuare...")
+        def run_job(job):
+            # Un file non scrivibile o un membro ZIP corrotto non ferma il resto del lotto
+            job.pop("error", None)
+            try:
+                job["target"].parent.mkdir(parents=True, exist_ok=True)
+                self._copy_job_to_sd(job, block_size, progress)
+            except OSError as e:
+                job["error"] = str(e)
+        
+        start = time.monotonic()
+        large = [job for job in jobs if job["size"] >= small_limit]
+        small = [job for job in jobs if job["size"] < small_limit]
+        try:
+            # I lettori USB raggiungono la velocità nominale solo con scritture sequenziali grandi
+            for job in large:
+                run_job(job)
+            if small:
+                workers = max(1, int(self.config.get("sd_copy_workers", 4)))
+                with ThreadPoolExecutor(max_workers=min(workers, len(small))) as executor:
+                    list(executor.map(run_job, small))
+            # fsync dei soli file del lotto: os.sync() attenderebbe anche le altre SD in scrittura
+            copied = self._flush_sd_targets([job for job in jobs if "error" not in job])
+        finally:
+            if pbar:
+                pbar.close()
+        
+        if not quiet:
+            elapsed = max(time.monotonic() - start, 1e-6)
+            print(f"💾 Scritti {written[0] / (1024*1024):.1f} MB sulla SD in {elapsed:.1f}s "
+                  f"({written[0] / (1024*1024) / elapsed:.1f} MB/s)")
+        return copied
+
+    def _flush_sd_targets(self, jobs):
+        """fsync dei file scritti e delle loro cartelle; restituisce le etichette dei file persistiti"""
+        flushed = []
+        directories = set()
+        for job in jobs:
+            try:
+                with open(job["target"], 'rb+') as f:
+                    os.fsync(f.fileno())
+            except OSError as e:
+                job["error"] = str(e)
+                continue
+            flushed.append(job["label"])
+            directories.add(job["target"].parent)
+        
+        if os.name != 'nt':
+            # Le rinomine da .tmp sono persistite con la cartella che le contiene
+            for directory in directories:
+                try:
+                    fd = os.open(directory, os.O_RDONLY)
+                    try:
+                        os.fsync(fd)
+                    finally:
+                        os.close(fd)
+                except OSError:
+                    pass
+        return flushed
 
-    def extract_zip(self, filepath):
-        """Estrae file ZIP con gestione errori"""
+    def _copy_job_to_sd(self, job, block_size, progress):
+        """Scrive un file sulla SD passando da un .tmp, dal file estratto o dal membro ZIP"""
+        target = job["target"]
+        tmp_target = target.with_name(target.name + ".tmp")
         try:
-            with zipfile.ZipFile(filepath, 'r') as zip_ref:
-                # Crea directory con nome del file
-                extract_dir = self.downloads_dir / filepath.stem
-                extract_dir.mkdir(exist_ok=True)
-                
-                # Estrai tutti i file
-                zip_ref.extractall(extract_dir)
-                
-            print(self.colorize(f"✅ Estrazione completata in: {extract_dir.name}", "green"))
-            return True
+            with open(tmp_target, 'wb', buffering=0) as dst:
+                if job["source"] is not None:
+                    self._copy_file_fast(job["source"], dst, block_size, progress)
+                else:
+                    try:
+                        with zipfile.ZipFile(job["archive"], 'r') as zip_ref:
+                            info = zip_ref.getinfo(job["member"])
+                            with zip_ref.open(info) as src:
+                                for block in iter(lambda: src.read(block_size), b''):
+                                    dst.write(block)
+                                    progress(len(block))
+                    except (zipfile.BadZipFile, KeyError) as e:
+                        # CRC errato o membro assente: per i chiamanti è un file non copiabile come gli altri
+                        raise OSError(f"{job['archive'].name} non valido: {e}") from e
             
-        except zipfile.BadZipFile:
-            print(self.colorize("❌ File ZIP corrotto o non valido", "red"))
-            return False
-        except Exception as e:
-            print(self.colorize(f"❌ Errore durante l'estrazione: {e}", "red"))
-            return False
+            if job["source"] is not None:
+                shutil.copystat(job["source"], tmp_target)
+            else:
+                # Data di modifica come nell'archivio, come farebbe l'estrazione
+                mtime = time.mktime(info.date_time + (0, 0, -1))
+                os.utime(tmp_target, (mtime, mtime))
+            os.replace(tmp_target, target)
+        except BaseException:
+            tmp_target.unlink(missing_ok=True)
+            raise
 
-    def check_system(self):
-        """Controllo sistema completo"""
-        self.clear_screen()
-        print(self.colorize("🔍 CONTROLLO SISTEMA IN CORSO...", "cyan"))
-        print("\n" + "="*50)
-        
-        checks = {
-            "Python Version 3.7+": sys.version_info >= (3, 7),
-            "Sistema Operativo Supportato": platform.system() in ["Windows", "Linux", "Darwin"],
-            "Connessione Internet": self.check_internet(),
-            "Spazio su Disco (>500MB)": self.check_disk_space(),
-            "Directory Download": self.downloads_dir.exists(),
-            "Dipendenze Installate": self.check_dependencies()
-        }
-        
-        all_ok = True
-        for check, result in checks.items():
-            status = "✅ OK" if result else "❌ FAIL"
-            color = "green" if result else "red"
-            print(f"{check}: {self.colorize(status, color)}")
-            if not result:
-                all_ok = False
+    def _copy_file_fast(self, source, dst, block_size, progress):
+        """Copia con copy_file_range/sendfile dove disponibili, altrimenti a blocchi grandi"""
+        with open(source, 'rb', buffering=0) as src:
+            size = os.fstat(src.fileno()).st_size
+            copied = 0
+            for fast_path in ("copy_file_range", "sendfile"):
+                func = getattr(os, fast_path, None)
+                if func is None or copied >= size:
+                    continue
+                try:
+                    while copied < size:
+                        count = min(block_size, size - copied)
+                        if fast_path == "copy_file_range":
+                            sent = func(src.fileno(), dst.fileno(), count, copied)
+                        else:
+                            sent = func(dst.fileno(), src.fileno(), copied, count)
+                        if sent == 0:
+                            break
+                        copied += sent
+                        progress(sent)
+                except OSError:
+                    # Filesystem o kernel senza supporto: si prova il percorso successivo
+                    continue
+            
+            if copied < size:
+                src.seek(copied)
+                buffer = memoryview(bytearray(block_size))
+                while True:
+                    count = src.readinto(buffer)
+                    if not count:
+                        break
+                    dst.write(buffer[:count])
+                    progress(count)
+
+    def _open_job_source(self, job):
+        """Apre in lettura la sorgente di un lavoro di copia (file estratto o membro ZIP)"""
+        if job["source"] is not None:
+            return open(job["source"], 'rb')
+        zip_ref = zipfile.ZipFile(job["archive"], 'r')
+        member = zip_ref.open(job["member"])
+        # Il membro aperto tiene vivo il file dell'archivio fino alla sua chiusura
+        zip_ref.close()
+        return member
+
+    def build_sd_image(self, total_sectors):
+        """Immagine FAT32 della SD preparata, in cache finché gli artefatti non cambiano"""
+        jobs = [job for name in SD_PAYLOADS for job in self.staging_jobs(name, Path())]
+        key = hashlib.sha256(json.dumps([
+            total_sectors, FAT32_CLUSTER_SIZE, SD_STRUCTURE,
+            sorted((job["target"].as_posix(), job["sha256"]) for job in jobs)
+        ]).encode()).hexdigest()
         
-        # Controllo file scaricati
-        print("\n" + self.colorize("📦 FILE SCARICATI:", "yellow"))
-        downloaded_files = list(self.downloads_dir.glob("*.zip"))
-        if downloaded_files:
-            for file in downloaded_files[:5]:  # Mostra solo primi 5 file
-                size = file.stat().st_size / (1024*1024)
-                print(f"📁 {file.name} ({size:.1f} MB)")
-            if len(downloaded_files) > 5:
-                print(f"... e altri {len(downloaded_files) - 5} file")
-        else:
-            print("Nessun file scaricato")
+        images_dir = self.cache_dir / "images"
+        images_dir.mkdir(parents=True, exist_ok=True)
+        image_path = images_dir / f"sd-{key[:16]}.img"
+        if image_path.exists():
+            print(f"♻️  Immagine FAT32 in cache: {image_path.name}")
+            return image_path
         
-        print("\n" + "="*50)
+        image = _Fat32Image(total_sectors)
+        for directory in SD_STRUCTURE:
+            image.add_dir(directory)
+        for job in jobs:
+            image.add_file(job["target"].as_posix(), job["size"], lambda job=job: self._open_job_source(job))
         
-        if all_ok:
-            print(self.colorize("✅ Sistema OK - Puoi procedere con il modding!", "green"))
-        else:
-            print(self.colorize("⚠️  Alcuni controlli hanno falluto. Controlla i requisiti.", "yellow"))
+        print(f"🧱 Costruzione immagine FAT32 ({len(jobs)} file, cluster da {FAT32_CLUSTER_SIZE // 1024} KiB)...")
+        tmp_path = image_path.with_name(image_path.name + ".tmp")
+        try:
+            image.write(tmp_path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+        os.replace(tmp_path, image_path)
         
-        input("\nPremi INVIO per continuare...")
+        # Le immagini precedenti non sono più valide
+        for old_image in images_dir.glob("sd-*.img"):
+            if old_image != image_path:
+                old_image.unlink(missing_ok=True)
+        return image_path
 
-    def check_internet(self):
-        """Controlla la connessione internet"""
+    def _is_mounted(self, target):
+        """True se il dispositivo risulta montato (solo dove esiste /proc/mounts)"""
+        real_path = os.path.realpath(target)
         try:
-            requests.get("https://github.com", timeout=10)
-            return True
-        except:
+            with open("/proc/mounts", 'r') as f:
+                return any(os.path.realpath(line.split()[0]) == real_path for line in f if line.strip())
+        except OSError:
             return False
 
-    def check_disk_space(self):
-        """Controlla lo spazio su disco"""
+    def write_sd_image(self, target):
+        """Scrive l'immagine FAT32 su partizione/dispositivo (o file immagine) in un'unica scrittura sequenziale"""
+        target = Path(target)
+        if not target.exists():
+            print(self.colorize(f"❌ Destinazione non trovata: {target}", "red"))
+            return False
+        if self._is_mounted(target):
+            print(self.colorize(f"❌ {target} è montato: smontalo prima di scrivere l'immagine", "red"))
+            return False
+        
         try:
-            total, used, free = shutil.disk_usage(self.base_dir)
-            return free > 500 * 1024 * 1024  # 500MB minimo
-        except:
+            with open(target, 'r+b', buffering=0) as dst:
+                # Funziona sia per i dispositivi a blocchi sia per i file immagine (loopback)
+                volume_size = os.lseek(dst.fileno(), 0, os.SEEK_END)
+                os.lseek(dst.fileno(), 0, os.SEEK_SET)
+                image_path = self.build_sd_image(volume_size // _Fat32Image.SECTOR_SIZE)
+                
+                image_size = image_path.stat().st_size
+                block_size = max(64, int(self.config.get("sd_copy_block_kb", 4096))) * 1024
+                print(f"💾 Scrittura di {image_size / (1024*1024):.1f} MB su {target}...")
+                pbar = None
+                if TQDM_AVAILABLE:
+                    pbar = tqdm(total=image_size, unit='B', unit_scale=True, desc=target.name, ncols=80)
+                start = time.monotonic()
+                with open(image_path, 'rb', buffering=0) as src:
+                    buffer = memoryview(bytearray(block_size))
+                    while True:
+                        count = src.readinto(buffer)
+                        if not count:
+                            break
+                        dst.write(buffer[:count])
+                        if pbar:
+                            pbar.update(count)
+                os.fsync(dst.fileno())
+                if pbar:
+                    pbar.close()
+        except (OSError, ValueError) as e:
+            print(self.colorize(f"❌ Scrittura immagine fallita: {e}", "red"))
             return False
+        
+        elapsed = max(time.monotonic() - start, 1e-6)
+        print(self.colorize(f"✅ Immagine scritta in {elapsed:.1f}s ({image_size / (1024*1024) / elapsed:.1f} MB/s)", "green"))
+        return True
 
-    def prepare_sd_card(self):
-        """Preparazione SD card completa"""
+    def write_sd_image_menu(self):
+        """Menu scrittura immagine FAT32"""
         self.clear_screen()
-        print(self.colorize("💾 PREPARAZIONE SCHEDA SD", "cyan"))
-        
-        # Rilevamento SD
-        if not self.sd_card_path or not self.sd_card_path.exists():
-            print("Inserisci il percorso della scheda SD:")
-            print("• Windows: E:\\")
-            print("• Linux: /media/username/sd/")
-            print("• Mac: /Volumes/SD/")
-            path = input("\nPercorso SD: ").strip()
-            self.sd_card_path = Path(path)
-            
-            # Salva nel config
-            self.config['sd_card_path'] = str(path)
-            self.save_config()
+        print(self.colorize("🧱 SCRITTURA IMMAGINE FAT32 SU SD", "cyan"))
+        self.wait_for_prefetch()
+        print("\nIndica la partizione della SD (es. /dev/sdb1) o un file immagine esistente.")
+        print(self.colorize("⚠️  Tutti i dati presenti verranno cancellati!", "yellow"))
+        target = input("\nDestinazione: ").strip()
+        if target and input(f"Confermi la sovrascrittura di {target}? (s/n): ").lower() == 's':
+            self.write_sd_image(target)
+        input("\nPremi INVIO per continuare...")
+
+    def _hash_uncached(self, path):
+        """SHA-256 letto dal dispositivo: O_DIRECT dove possibile, altrimenti dopo aver scartato la page cache"""
+        if hasattr(os, "O_DIRECT"):
+            try:
+                return self._hash_fd(os.open(path, os.O_RDONLY | os.O_DIRECT))
+            except OSError:
+                # Filesystem senza supporto O_DIRECT (in apertura o in lettura)
+                pass
+        fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+        self._drop_page_cache(fd)
+        return self._hash_fd(fd)
+
+    def _hash_fd(self, fd):
+        """SHA-256 del descrittore (che viene chiuso) letto a blocchi in un buffer allineato"""
+        hasher = hashlib.sha256()
+        # mmap anonimo: buffer allineato alla pagina, come richiesto da O_DIRECT
+        buffer = mmap.mmap(-1, SD_COPY_BLOCK)
+        view = memoryview(buffer)
+        try:
+            while True:
+                count = os.readv(fd, [buffer])
+                if not count:
+                    break
+                hasher.update(view[:count])
+        finally:
+            view.release()
+            buffer.close()
+            os.close(fd)
+        return hasher.hexdigest()
+
+    def verify_sd(self, sd_path, jobs):
+        """Rilegge dal dispositivo i file posizionati e li confronta con gli hash delle sorgenti"""
+        bad = []
+        for job in jobs:
+            try:
+                if self._hash_uncached(job["target"]) != job["sha256"]:
+                    bad.append(job)
+            except OSError:
+                bad.append(job)
         
-        if not self.sd_card_path.exists():
-            print(self.colorize("❌ Percorso non valido! La SD non è accessibile.", "red"))
-            input("\nPremi INVIO per continuare...")
-            return
+        if bad:
+            # I file corrotti escono dal manifest: la prossima sincronizzazione li riscrive
+            with self._manifest_lock:
+                manifest = self.load_sd_manifest(sd_path)
+                for job in bad:
+                    manifest["files"].pop(job["target"].relative_to(sd_path).as_posix(), None)
+                manifest.pop("fingerprint", None)
+                self._save_sd_manifest(sd_path, manifest)
+        return [job["target"].relative_to(sd_path).as_posix() for job in bad]
+
+    def verify_cards(self, paths):
+        """Verifica in rilettura più SD in parallelo, una per worker"""
+        base_jobs = [job for name in SD_PAYLOADS for job in self.staging_jobs(name, Path())]
+        if not paths or not base_jobs:
+            print(self.colorize("❌ Nessuna SD o nessun file essenziale da verificare", "red"))
+            return False
         
-        print(f"\nScheda SD rilevata: {self.colorize(str(self.sd_card_path), 'green')}")
+        def verify(path):
+            start = time.monotonic()
+            return path, self.verify_sd(path, [dict(job, target=path / job["target"]) for job in base_jobs]), time.monotonic() - start
         
-        # Creazione struttura directory SD
-        sd_structure = [
-            "3ds",
-            "cias",
-            "files9",
-            "luma",
-            "luma/payloads",
-            "themes",
-            "gm9",
-            "gm9/out",
-            "gm9/scripts"
+        all_ok = True
+        with ThreadPoolExecutor(max_workers=len(paths)) as executor:
+            for path, bad, elapsed in executor.map(verify, [Path(path) for path in paths]):
+                if bad:
+                    all_ok = False
+                    print(self.colorize(f"   ❌ {path}: {', '.join(bad)} non corrispondono alla sorgente", "red"))
+                else:
+                    print(self.colorize(f"   ✅ {path}: {len(base_jobs)} file identici ({elapsed:.1f}s)", "green"))
+        return all_ok
+
+    def _report_verify(self, bad):
+        """Messaggio della verifica in rilettura dopo una copia sulla SD"""
+        if bad:
+            print(self.colorize(f"❌ Verifica in rilettura fallita: {', '.join(bad)} (verranno riscritti al prossimo avvio)", "red"))
+        else:
+            print(self.colorize("🔎 Verifica in rilettura: file identici alla sorgente", "green"))
+
+    def _find_zip_member(self, zip_ref, filename):
+        """Membro dell'archivio con il nome indicato (il percorso più corto)"""
+        matches = [
+            info for info in zip_ref.infolist()
+            if not info.is_dir() and PurePosixPath(info.filename).name == filename
         ]
-        
-        print("\nCreazione struttura directory...")
-        for directory in sd_structure:
-            dir_path = self.sd_card_path / directory
-            dir_path.mkdir(parents=True, exist_ok=True)
-            print(f"📁 {directory}")
-        
-        # Copia file essenziali
-        self.copy_essential_files()
-        
-        print(self.colorize("\n✅ SD card preparata con successo!", "green"))
-        input("\nPremi INVIO per continuare...")
+        return min(matches, key=lambda info: len(info.filename)) if matches else None
 
     def copy_essential_files(self):
         """Copia file essenziali sulla SD"""
         print("\n📋 Copia file essenziali...")
         
-        files_copied = 0
-        
-        # Cerca e copia boot.firm (Luma3DS)
-        luma_dirs = ["luma3ds", "Luma3DS"]
-        for luma_dir in luma_dirs:
-            luma_path = self.downloads_dir / luma_dir / "boot.firm"
-            if luma_path.exists():
-                shutil.copy2(luma_path, self.sd_card_path / "boot.firm")
-                print("📄 boot.firm → SD (root)")
-                files_copied += 1
-                break
-        
-        # Cerca e copia boot.3dsx (Homebrew Launcher)
-        hb_dirs = ["homebrew_launcher", "boot.3dsx"]
-        for hb_dir in hb_dirs:
-            hb_path = self.downloads_dir / hb_dir / "boot.3dsx"
-            if hb_path.exists():
-                shutil.copy2(hb_path, self.sd_card_path / "boot.3dsx")
-                print("📄 boot.3dsx → SD (root)")
-                files_copied += 1
-                break
+        # boot.firm (Luma3DS), boot.3dsx (Homebrew Launcher), GodMode9.firm
+        jobs = []
+        for name in SD_PAYLOADS:
+            entry = self.get_artifact_entry(name)
+            if entry and entry["missing"]:
+                # Layout dell'archivio cambiato: meglio dirlo che copiare in silenzio meno file
+                print(self.colorize(f"⚠️  {', '.join(entry['missing'])} non presente in {name}.zip", "yellow"))
+            jobs.extend(self.staging_jobs(name, self.sd_card_path))
         
-        # Cerca e copia GodMode9.firm
-        gm9_dirs = ["godmode9", "GodMode9"]
-        for gm9_dir in gm9_dirs:
-            gm9_path = self.downloads_dir / gm9_dir / "GodMode9.firm"
-            if gm9_path.exists():
-                shutil.copy2(gm9_path, self.sd_card_path / "luma/payloads/GodMode9.firm")
-                print("📄 GodMode9.firm → SD/luma/payloads/")
-                files_copied += 1
-                break
+        # Un solo lotto (un solo flush finale), solo per i file mancanti o cambiati
+        copied, skipped = self.sync_sd(self.sd_card_path, jobs, quiet=False)
+        for filename, destination in copied:
+            if destination:
+                print(f"📄 {filename} → SD/{destination}/")
+            else:
+                print(f"📄 {filename} → SD (root)")
+        files_copied = len(copied)
+        if skipped:
+            print(f"⏭️  {len(skipped)} file già aggiornati sulla SD")
+        copy_ok = self._report_copy_errors(jobs)
+        written = [job for job in jobs if "error" not in job]
+        if written and self.config.get("sd_verify", True):
+            self._report_verify(self.verify_sd(self.sd_card_path, written))
         
-        if files_copied == 0:
+        if not jobs:
             print(self.colorize("⚠️  Nessun file essenziale trovato. Esegui prima i download.", "yellow"))
-        else:
+        elif not copy_ok:
+            print(self.colorize(f"⚠️  Copiati {files_copied} file essenziali, alcuni non sono stati scritti", "yellow"))
+        elif files_copied:
             print(self.colorize(f"✅ Copiati {files_copied} file essenziali!", "green"))
+        else:
+            print(self.colorize("✅ File essenziali già aggiornati!", "green"))
 
     def modding_methods(self):
         """Menu metodi modding"""
@@ -727,20 +3140,26 @@ FLASHCARD COMPATIBILI:
             else:
                 return False
         
-        # Estrazione Boot9Strap
-        print("📦 Estrazione Boot9Strap...")
+        # Estrazione Boot9Strap (serve solo se non si copia in streaming dallo ZIP)
         boot9strap_zip = self.downloads_dir / "boot9strap.zip"
-        if boot9strap_zip.exists():
+        if boot9strap_zip.exists() and not self.config.get("stream_from_zip", True):
+            print("📦 Estrazione Boot9Strap...")
             self.extract_zip(boot9strap_zip)
         
-        # Copia file Boot9Strap sulla SD
-        boot9strap_dir = self.downloads_dir / "boot9strap"
-        if boot9strap_dir.exists():
-            # Copia boot9strap.firm e boot9strap.firm.sha
-            for file in boot9strap_dir.glob("*"):
-                if file.is_file():
-                    shutil.copy2(file, self.sd_card_path / "boot9strap")
-                    print(f"📄 {file.name} → SD/boot9strap/")
+        # Copia boot9strap.firm e boot9strap.firm.sha sulla SD
+        jobs = self.staging_jobs("boot9strap", self.sd_card_path, BOOT9STRAP_PAYLOADS)
+        copied, skipped = self.sync_sd(self.sd_card_path, jobs, quiet=False)
+        for filename, destination in skipped:
+            print(f"⏭️  {filename} già aggiornato su SD/{destination}/")
+        for filename, destination in copied:
+            print(f"📄 {filename} → SD/{destination}/")
+        if not self._report_copy_errors(jobs):
+            return False
+        if jobs and self.config.get("sd_verify", True):
+            bad = self.verify_sd(self.sd_card_path, jobs)
+            self._report_verify(bad)
+            if bad:
+                return False
         
         print(self.colorize("✅ Boot9Strap installato con successo!", "green"))
         
@@ -768,9 +3187,14 @@ FLASHCARD COMPATIBILI:
                 print(self.colorize("✅ Dimensione corretta!", "green"))
                 
                 # Calcola hash MD5
-                with open(movable_path, 'rb') as f:
-                    file_hash = hashlib.md5(f.read()).hexdigest()
+                file_hash = self.hash_files([movable_path], ("md5",))[movable_path][0]["md5"]
                 print(f"🔢 MD5: {file_hash}")
+                expected = self.expected_digests("movable.sed").get("md5")
+                if expected:
+                    if expected == file_hash:
+                        print(self.colorize("✅ MD5 corrispondente", "green"))
+                    else:
+                        print(self.colorize(f"❌ MD5 diverso dall'atteso ({expected})", "red"))
                 
             else:
                 print(self.colorize("⚠️  Dimensione anomala! Dovrebbe essere 320 byte", "yellow"))
@@ -794,6 +3218,10 @@ FLASHCARD COMPATIBILI:
 {self.colorize('2.', 'green')} Pulizia File Temporanei
 {self.colorize('3.', 'green')} Controllo Checksum File
 {self.colorize('4.', 'green')} Diagnostica Sistema
+{self.colorize('5.', 'green')} Scrivi Immagine FAT32 su SD
+{self.colorize('6.', 'green')} Preparazione Multi-SD
+{self.colorize('7.', 'green')} Preparazione Automatica all'Inserimento
+{self.colorize('8.', 'green')} Test Velocità e Capacità SD
 {self.colorize('0.', 'red')} Torna al Menu
             """)
             
@@ -807,6 +3235,16 @@ FLASHCARD COMPATIBILI:
                 self.check_checksums()
             elif choice == "4":
                 self.system_diagnostics()
+            elif choice == "5":
+                self.write_sd_image_menu()
+            elif choice == "6":
+                self.batch_provision_menu()
+            elif choice == "7":
+                self.clear_screen()
+                self.auto_provision()
+                input("\nPremi INVIO per continuare...")
+            elif choice == "8":
+                self.sd_test_menu()
             elif choice == "0":
                 break
             else:
@@ -829,10 +3267,16 @@ FLASHCARD COMPATIBILI:
         
         all_ok = True
         for file in required_files:
-            file_path = self.downloads_dir / file
-            if file_path.exists():
-                size = file_path.stat().st_size / (1024*1024)
-                print(f"✅ {file} ({size:.1f} MB)")
+            # Dati dall'indice degli artefatti: niente scansione dei file estratti
+            entry = self.get_artifact_entry(Path(file).stem)
+            if entry:
+                size = entry["archive"]["size"] / (1024*1024)
+                print(f"✅ {file} ({size:.1f} MB, SHA-256 {entry['archive']['sha256'][:16]}...)")
+                for filename, payload in entry["payloads"].items():
+                    print(f"   📄 {filename} ({payload['size']} byte) → SD/{payload['destination']}")
+                for filename in entry["missing"]:
+                    print(self.colorize(f"   ⚠️  {filename} non trovato nell'archivio", "yellow"))
+                    all_ok = False
             else:
                 print(f"❌ {file} - MANCANTE")
                 all_ok = False
@@ -867,14 +3311,15 @@ FLASHCARD COMPATIBILI:
                     except Exception as e:
                         print(f"⚠️  Errore eliminazione {file.name}: {e}")
         
-        # Pulizia download parziali
-        for file in self.downloads_dir.glob("*.tmp"):
-            try:
-                file.unlink()
-                cleaned += 1
-                print(f"🗑️  Eliminato: {file.name}")
-            except:
-                pass
+        # Pulizia download parziali (inclusi i .part lasciati dai download interrotti)
+        for pattern in ("*.tmp", "*.part", "*.segments", "*.resume"):
+            for file in self.downloads_dir.glob(pattern):
+                try:
+                    file.unlink()
+                    cleaned += 1
+                    print(f"🗑️  Eliminato: {file.name}")
+                except:
+                    pass
         
         print(self.colorize(f"\n✅ Pulizia completata! Elementi eliminati: {cleaned}", "green"))
         input("\nPremi INVIO per continuare...")
@@ -886,23 +3331,33 @@ FLASHCARD COMPATIBILI:
         
         print("Questa funzione verifica l'integrità dei file scaricati.\n")
         
-        files_to_check = list(self.downloads_dir.glob("*.zip"))
+        files_to_check = sorted(self.downloads_dir.glob("*.zip"))
         if not files_to_check:
             print(self.colorize("❌ Nessun file ZIP trovato da verificare.", "red"))
             input("\nPremi INVIO per continuare...")
             return
         
-        for file in files_to_check[:3]:  # Verifica solo primi 3 file
-            try:
-                with open(file, 'rb') as f:
-                    file_hash = hashlib.md5(f.read()).hexdigest()
-                print(f"📄 {file.name}")
-                print(f"   MD5: {file_hash[:16]}...")
+        start = time.monotonic()
+        results = self.hash_files(files_to_check, self.digest_algorithms())
+        for file in files_to_check:
+            result = results[file]
+            if isinstance(result, OSError):
+                print(f"❌ Errore verifica {file.name}: {result}\n")
+                continue
+            digests, cached = result
+            print(f"📄 {file.name}{' (cache)' if cached else ''}")
+            for algorithm, digest in digests.items():
+                print(f"   {algorithm.upper()}: {digest[:16]}...")
+            expected = self.expected_digests(file.name)
+            mismatched = [a for a in digests if a in expected and expected[a] != digests[a]]
+            if not any(a in expected for a in digests):
+                print(self.colorize("   ⚪ Nessun checksum di riferimento", "yellow") + "\n")
+            elif not mismatched:
                 print(self.colorize("   ✅ Integro", "green") + "\n")
-            except Exception as e:
-                print(f"❌ Errore verifica {file.name}: {e}\n")
+            else:
+                print(self.colorize(f"   ❌ NON corrisponde ({', '.join(a.upper() for a in mismatched)} diverso dall'atteso)", "red") + "\n")
         
-        print(self.colorize("Verifica checksum completata!", "green"))
+        print(self.colorize(f"Verifica checksum completata in {time.monotonic() - start:.1f}s!", "green"))
         input("\nPremi INVIO per continuare...")
 
     def system_diagnostics(self):
@@ -928,16 +3383,13 @@ FLASHCARD COMPATIBILI:
         # Controlli aggiuntivi
         print("\n" + self.colorize("CONTROLLI AVANZATI:", "cyan"))
         
-        checks = {
-            "SD scrivibile": self.check_sd_writable(),
-            "Connessione GitHub": self.check_github_connection(),
-            "File essenziali": self.check_essential_files()
-        }
-        
-        for check, result in checks.items():
-            status = "✅ OK" if result else "❌ FAIL"
-            color = "green" if result else "red"
-            print(f"{check}: {self.colorize(status, color)}")
+        deadline = self.config.get("probe_deadline", 5)
+        checks = self.run_probes({
+            "SD scrivibile e idonea": ("sd_card", self.check_sd_card, deadline),
+            "Connessione GitHub": ("github", self.check_github_connection, deadline),
+            "File essenziali": ("essential_files", self.check_essential_files, deadline)
+        })
+        self.print_probe_results(checks)
         
         input("\nPremi INVIO per continuare...")
 
@@ -949,24 +3401,315 @@ FLASHCARD COMPATIBILI:
         except:
             return 0
 
-    def check_sd_writable(self):
-        """Controlla se la SD è scrivibile"""
+    def _drop_page_cache(self, fd):
+        """Scarta le pagine in cache del file (dopo fsync), così le letture arrivano dal dispositivo"""
+        if hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+
+    def _mount_source(self, path):
+        """Dispositivo montato sul percorso (il punto di montaggio più specifico)"""
+        real_path = os.path.realpath(path)
+        best = None
+        for entry in self._mountinfo_entries():
+            mount_point = entry["mount_point"]
+            if real_path == mount_point or real_path.startswith(mount_point.rstrip("/") + "/"):
+                if best is None or len(mount_point) > len(best["mount_point"]):
+                    best = entry
+        return best["source"] if best else None
+
+    def _volume_uuid(self, source):
+        """UUID del volume da /dev/disk/by-uuid (per FAT il seriale XXXX-XXXX, leggibile senza root)"""
+        by_uuid = Path("/dev/disk/by-uuid")
+        try:
+            for link in by_uuid.iterdir():
+                if os.path.realpath(link) == os.path.realpath(source):
+                    return link.name.upper()
+        except OSError:
+            pass
+        return None
+
+    def _card_identity(self, path):
+        """(id della scheda, fonte): stesso id per partizione smontata e SD montata"""
+        path = Path(path)
+        device = path if not path.is_dir() else self._mount_source(path)
+        if device:
+            volume_uuid = self._volume_uuid(device)
+            if volume_uuid:
+                return f"vol-{volume_uuid}", "by-uuid"
+            # Senza udev (o per un file immagine) il seriale si legge dal boot sector, se accessibile
+            try:
+                with open(device, 'rb') as f:
+                    boot = f.read(512)
+                if boot[510:512] == b"\x55\xAA" and boot[82:87] == b"FAT32":
+                    volume_id, = struct.unpack_from("<I", boot, 67)
+                    return f"vol-{volume_id >> 16:04X}-{volume_id & 0xFFFF:04X}", "boot-sector"
+            except OSError:
+                pass
+        
+        if not path.is_dir():
+            return f"dev-{os.path.realpath(path)}", "device-path"
+        with self._manifest_lock:
+            manifest = self.load_sd_manifest(path)
+            if "card_id" not in manifest:
+                manifest["card_id"] = hashlib.sha256(os.urandom(16)).hexdigest()[:16]
+                self._save_sd_manifest(path, manifest)
+        return f"card-{manifest['card_id']}", "manifest"
+
+    def card_id(self, path):
+        """Identità della scheda: seriale del volume (by-uuid o boot sector), altrimenti un id nel manifest"""
+        return self._card_identity(path)[0]
+
+    def _load_sd_grades(self):
+        """Risultati dei test per scheda (logs/sd_cards.json)"""
+        return _read_json(self.base_dir / "logs" / "sd_cards.json", {})
+
+    def _store_sd_grade(self, card, results):
+        """Aggiunge i risultati di un test a quelli già salvati per la scheda"""
+        with self._grades_lock:
+            grades = self._load_sd_grades()
+            entry = grades.setdefault(card, {})
+            entry.update(results)
+            entry["updated"] = datetime.now().isoformat()
+            _write_json_atomic(self.base_dir / "logs" / "sd_cards.json", grades)
+        return entry
+
+    def sd_rejection_reason(self, sd_path):
+        """Motivo per scartare la scheda secondo i test salvati (None se accettabile o mai testata)"""
+        grades = self._load_sd_grades()
+        grade = grades.get(self.card_id(sd_path)) if grades else None
+        if not grade:
+            return None
+        capacity = grade.get("capacity")
+        if capacity and not capacity["ok"]:
+            where = "dei dati di prova" if capacity["mode"] == "full" else "del dispositivo"
+            return f"capacità falsa: dati corrotti oltre {capacity['first_bad_offset'] / (1024**3):.1f} GB {where}"
+        min_speed = float(self.config.get("sd_min_write_mbs", 4))
+        if grade.get("seq_write_mbs", min_speed) < min_speed:
+            return f"scheda lenta: {grade['seq_write_mbs']:.1f} MB/s in scrittura (minimo {min_speed:.1f})"
+        return None
+
+    def benchmark_sd(self, sd_path):
+        """Scrittura/lettura sequenziale, I/O casuale a 4 KiB e file piccoli, con la cache bypassata in lettura"""
+        bench_file = sd_path / ".ms17mod_bench.tmp"
+        free = shutil.disk_usage(sd_path).free
+        size = min(int(self.config.get("sd_bench_mb", 64)) * 1024 * 1024, free // 2)
+        size -= size % SD_COPY_BLOCK
+        if size <= 0:
+            raise OSError("spazio libero insufficiente per il test")
+        
+        block = os.urandom(SD_COPY_BLOCK)
+        results = {}
+        try:
+            with open(bench_file, 'w+b', buffering=0) as f:
+                fd = f.fileno()
+                start = time.monotonic()
+                for _ in range(size // SD_COPY_BLOCK):
+                    f.write(block)
+                os.fsync(fd)
+                results["seq_write_mbs"] = size / (1024*1024) / max(time.monotonic() - start, 1e-6)
+                
+                self._drop_page_cache(fd)
+                f.seek(0)
+                start = time.monotonic()
+                buffer = bytearray(SD_COPY_BLOCK)
+                while f.readinto(buffer):
+                    pass
+                results["seq_read_mbs"] = size / (1024*1024) / max(time.monotonic() - start, 1e-6)
+                
+                # I/O casuale a 4 KiB: scritture sincrone e letture dal dispositivo
+                offsets = [int.from_bytes(os.urandom(4), "little") % (size // 4096) * 4096 for _ in range(64)]
+                start = time.monotonic()
+                for offset in offsets:
+                    os.pwrite(fd, block[:4096], offset)
+                    os.fsync(fd)
+                results["rand_write_iops"] = len(offsets) / max(time.monotonic() - start, 1e-6)
+                
+                self._drop_page_cache(fd)
+                start = time.monotonic()
+                for offset in offsets * 4:
+                    os.pread(fd, 4096, offset)
+                    self._drop_page_cache(fd)
+                results["rand_read_iops"] = len(offsets) * 4 / max(time.monotonic() - start, 1e-6)
+        finally:
+            bench_file.unlink(missing_ok=True)
+        
+        results.update(self._benchmark_small_files(sd_path, block))
+        return results
+
+    def _benchmark_small_files(self, sd_path, data):
+        """File da 4-32 KiB creati uno a uno con fsync in una cartella temporanea, poi riletti (file/s)"""
+        bench_dir = sd_path / ".ms17mod_bench"
+        count = int(self.config.get("sd_bench_small_files", 256))
+        files = [(bench_dir / f"{index}.bin", 4096 * (1 + index % 8)) for index in range(count)]
+        results = {}
+        bench_dir.mkdir(exist_ok=True)
+        try:
+            # Ogni file costa allocazione dei cluster, voce di directory e aggiornamento della FAT
+            start = time.monotonic()
+            for path, size in files:
+                with open(path, 'wb', buffering=0) as f:
+                    f.write(data[:size])
+                    os.fsync(f.fileno())
+            results["small_write_files_s"] = count / max(time.monotonic() - start, 1e-6)
+            
+            start = time.monotonic()
+            for path, size in files:
+                with open(path, 'rb', buffering=0) as f:
+                    self._drop_page_cache(f.fileno())
+                    f.read(size)
+            results["small_read_files_s"] = count / max(time.monotonic() - start, 1e-6)
+        finally:
+            shutil.rmtree(bench_dir, ignore_errors=True)
+        return results
+
+    def _pattern_block(self, base, offset, size):
+        """Blocco di prova: ogni 4 KiB porta il proprio offset assoluto (stile F3)"""
+        block = bytearray(base[:size])
+        for position in range(0, size, 4096):
+            struct.pack_into("<Q", block, position, offset + position)
+        return block
+
+    def fill_and_verify(self, sd_path):
+        """Modalità completa: riempie lo spazio libero con dati marcati e li rilegge dal dispositivo"""
+        # Occupazione letta prima di scrivere: dopo la pulizia non direbbe nulla sulla regione riempita
+        usage = shutil.disk_usage(sd_path)
+        fill_dir = sd_path / ".ms17mod_fill"
+        fill_dir.mkdir(exist_ok=True)
+        base = hashlib.sha256(b"ms17mod").digest() * (SD_COPY_BLOCK // 32)
+        file_size = 1024 ** 3
+        written = 0
+        bad = 0
+        first_bad = None
+        try:
+            # Scrittura: file da 1 GiB finché c'è spazio
+            index = 0
+            full = False
+            while not full:
+                try:
+                    with open(fill_dir / f"{index}.fill", 'wb', buffering=0) as f:
+                        while written < (index + 1) * file_size:
+                            count = f.write(self._pattern_block(base, written, SD_COPY_BLOCK))
+                            written += count
+                            if count < SD_COPY_BLOCK:
+                                full = True
+                                break
+                        os.fsync(f.fileno())
+                except OSError:
+                    # Disco pieno
+                    full = True
+                index += 1
+            
+            # Verifica: ogni blocco deve riportare il proprio offset
+            for fill_file in sorted(fill_dir.glob("*.fill"), key=lambda p: int(p.stem)):
+                offset = int(fill_file.stem) * file_size
+                with open(fill_file, 'rb', buffering=0) as f:
+                    os.fsync(f.fileno())
+                    self._drop_page_cache(f.fileno())
+                    while True:
+                        data = f.read(SD_COPY_BLOCK)
+                        if not data:
+                            break
+                        if data != self._pattern_block(base, offset, len(data)):
+                            bad += len(data)
+                            first_bad = offset if first_bad is None else first_bad
+                        offset += len(data)
+        finally:
+            shutil.rmtree(fill_dir, ignore_errors=True)
+        
+        # first_bad_offset è relativo all'inizio della regione riempita (i primi byte scritti)
+        return {"mode": "full", "ok": bad == 0, "tested_bytes": written, "bad_bytes": bad,
+                "first_bad_offset": first_bad, "used_before": usage.used, "free_before": usage.free}
+
+    def probe_capacity(self, device, samples=256):
+        """Modalità rapida (come f3probe): blocchi campione su tutta la capacità del dispositivo smontato"""
+        if self._is_mounted(device):
+            raise OSError(f"{device} è montato: smontalo prima del test rapido")
+        
+        with open(device, 'r+b', buffering=0) as f:
+            fd = f.fileno()
+            size = os.lseek(fd, 0, os.SEEK_END)
+            offsets = sorted({size * i // samples // 4096 * 4096 for i in range(samples)} | {size // 4096 * 4096 - 4096})
+            base = hashlib.sha256(b"ms17mod").digest() * 128
+            
+            self._drop_page_cache(fd)
+            originals = [os.pread(fd, 4096, offset) for offset in offsets]
+            bad = []
+            try:
+                for offset in offsets:
+                    os.pwrite(fd, self._pattern_block(base, offset, 4096), offset)
+                os.fsync(fd)
+                self._drop_page_cache(fd)
+                bad = [offset for offset in offsets if os.pread(fd, 4096, offset) != self._pattern_block(base, offset, 4096)]
+            finally:
+                # Il test non è distruttivo: si ripristinano i blocchi originali
+                for offset, original in zip(offsets, originals):
+                    os.pwrite(fd, original, offset)
+                os.fsync(fd)
+        
+        return {"mode": "quick", "ok": not bad, "tested_bytes": size, "bad_bytes": len(bad) * 4096,
+                "first_bad_offset": bad[0] if bad else None}
+
+    def check_sd_card(self):
+        """SD scrivibile e non scartata dai test salvati (il benchmark si avvia solo da Test Velocità)"""
         if not self.sd_card_path or not self.sd_card_path.exists():
             return False
-        
         try:
             test_file = self.sd_card_path / "test_write.tmp"
             with open(test_file, 'w') as f:
                 f.write("test")
             test_file.unlink()
-            return True
-        except:
+        except OSError:
             return False
+        return self.sd_rejection_reason(self.sd_card_path) is None
+
+    def sd_test_menu(self):
+        """Menu test velocità e capacità SD"""
+        self.clear_screen()
+        print(self.colorize("🏁 TEST VELOCITÀ E CAPACITÀ SD", "cyan"))
+        print(f"""
+{self.colorize('1.', 'green')} Test velocità (SD montata)
+{self.colorize('2.', 'green')} Verifica capacità rapida (partizione smontata, campionata)
+{self.colorize('3.', 'green')} Verifica capacità completa (SD montata, riempie lo spazio libero)
+        """)
+        choice = input("\nSeleziona opzione: ").strip()
+        if choice not in ("1", "2", "3"):
+            return
+        target = Path(input("Percorso SD o partizione: ").strip())
+        
+        try:
+            card, id_source = self._card_identity(target)
+            if choice == "1":
+                print("⏱️  Test in corso...")
+                results = self.benchmark_sd(target)
+                print(f"   Scrittura sequenziale: {results['seq_write_mbs']:.1f} MB/s")
+                print(f"   Lettura sequenziale: {results['seq_read_mbs']:.1f} MB/s")
+                print(f"   Scrittura casuale 4K: {results['rand_write_iops']:.0f} IOPS")
+                print(f"   Lettura casuale 4K: {results['rand_read_iops']:.0f} IOPS")
+                print(f"   File piccoli (4-32 KiB): {results['small_write_files_s']:.0f} file/s in scrittura, "
+                      f"{results['small_read_files_s']:.0f} file/s in lettura")
+                self._store_sd_grade(card, dict(results, id_source=id_source))
+            else:
+                print("🔍 Verifica capacità in corso (può richiedere molto tempo)...")
+                capacity = self.probe_capacity(target) if choice == "2" else self.fill_and_verify(target)
+                self._store_sd_grade(card, {"capacity": capacity, "id_source": id_source})
+                if capacity["ok"]:
+                    print(self.colorize(f"✅ {capacity['tested_bytes'] / (1024**3):.1f} GB verificati senza errori", "green"))
+                else:
+                    print(self.colorize(f"❌ {capacity['bad_bytes'] / (1024**2):.1f} MB corrotti: probabile SD contraffatta", "red"))
+            
+            reason = self.sd_rejection_reason(target)
+            if reason:
+                print(self.colorize(f"⛔ Scheda da scartare ({reason})", "red"))
+            else:
+                print(self.colorize("✅ Scheda idonea", "green"))
+        except OSError as e:
+            print(self.colorize(f"❌ Test fallito: {e}", "red"))
+        input("\nPremi INVIO per continuare...")
 
     def check_github_connection(self):
         """Controlla connessione a GitHub"""
         try:
-            response = requests.get("https://api.github.com", timeout=10)
+            response = self.get_probe_session().get("https://api.github.com", timeout=self.get_http_timeout(10))
             return response.status_code == 200
         except:
             return False
@@ -1066,6 +3809,9 @@ FLASHCARD COMPATIBILI:
             print(self.colorize("✅ Backup completato con successo!", "green"))
             backup_size = self.get_folder_size(backup_dir) / (1024*1024*1024)
             print(f"📏 Dimensione backup: {backup_size:.2f} GB")
+            # Digest per verificare in futuro le copie del backup
+            self.write_digest_manifest(backup_dir)
+            print(f"🔢 Digest salvati in {backup_dir / 'digests.json'}")
         else:
             print(self.colorize("⚠️  Backup parziale. Alcuni file mancano.", "yellow"))
             print("File mancanti:")
@@ -1375,6 +4121,8 @@ Directory: {self.base_dir}
 {self.colorize('2.', 'green')} Rilevamento Auto SD: {self.config.get('auto_detect_sd', True)}
 {self.colorize('3.', 'green')} Reset Configurazione
 {self.colorize('4.', 'green')} Verifica Aggiornamenti
+{self.colorize('5.', 'green')} Download Simultanei: {self.config.get('max_concurrent_downloads', 6)}
+{self.colorize('6.', 'green')} Prefetch all'avvio: {self.config.get('background_prefetch', False)}
 {self.colorize('0.', 'red')} Torna al Menu
             """)
             
@@ -1411,12 +4159,159 @@ Directory: {self.base_dir}
             elif choice == "4":
                 self.check_for_updates()
                 
+            elif choice == "5":
+                value = input("Numero massimo di download simultanei (1-16): ").strip()
+                if value.isdigit() and 1 <= int(value) <= 16:
+                    self.config['max_concurrent_downloads'] = int(value)
+                    self.save_config()
+                    print(self.colorize("✅ Download simultanei aggiornati!", "green"))
+                else:
+                    print(self.colorize("❌ Valore non valido!", "red"))
+                time.sleep(1)
+                
+            elif choice == "6":
+                self.config['background_prefetch'] = not self.config.get('background_prefetch', False)
+                self.save_config()
+                status = "abilitato" if self.config['background_prefetch'] else "disabilitato"
+                print(self.colorize(f"✅ Prefetch all'avvio {status}!", "green"))
+                time.sleep(1)
+                
             elif choice == "0":
                 break
             else:
                 print(self.colorize("❌ Opzione non valida!", "red"))
                 time.sleep(1)
 
+    def _github_release_source(self, name):
+        """Ricava (owner/repo, tag, nome asset) dall'URL GitHub di un artefatto"""
+        for mirror in self.get_mirrors(name):
+            parsed = urlparse(mirror)
+            parts = parsed.path.strip('/').split('/')
+            if parsed.netloc == "github.com" and len(parts) >= 6 and parts[2:4] == ["releases", "download"]:
+                return f"{parts[0]}/{parts[1]}", parts[4], parts[5]
+        return None
+
+    def _load_release_cache(self):
+        """Carica (una volta) la cache su disco dei metadati delle release"""
+        if self._release_cache is None:
+            self._release_cache = _read_json(self.cache_dir / "releases.json", {})
+            self._release_cache.setdefault("repos", {})
+            self._release_cache.setdefault("rate_limit", {})
+        return self._release_cache
+
+    def _save_release_cache(self):
+        """Salva la cache delle release in modo atomico"""
+        _write_json_atomic(self.cache_dir / "releases.json", self._release_cache)
+
+    def resolve_release(self, repo):
+        """Ultima release di owner/repo: cache con TTL, revalidazione ETag e rate limit"""
+        now = time.time()
+        ttl = self.config.get("release_cache_ttl", 3600)
+        
+        with self._release_lock:
+            cache = self._load_release_cache()
+            entry = cache["repos"].get(repo)
+            if entry and now - entry["fetched_at"] < ttl:
+                return dict(entry["release"], source="cache")
+            rate_limit = cache["rate_limit"]
+            if rate_limit.get("remaining") == 0 and rate_limit.get("reset", 0) > now:
+                # Limite esaurito: si usa la copia locale (anche scaduta) fino al reset
+                return dict(entry["release"], source="cache (rate limit)") if entry else None
+        
+        headers = {"Accept": "application/vnd.github+json"}
+        if entry and entry.get("etag"):
+            # Le richieste condizionali con risposta 304 non consumano il rate limit
+            headers["If-None-Match"] = entry["etag"]
+        if self.config.get("github_token"):
+            headers["Authorization"] = f"Bearer {self.config['github_token']}"
+        
+        api_url = self.config.get("github_api_url", "https://api.github.com").rstrip('/')
+        response = self.get_session().get(
+            f"{api_url}/repos/{repo}/releases/latest",
+            headers=headers,
+            timeout=self.get_http_timeout(10)
+        )
+        
+        with self._release_lock:
+            cache = self._load_release_cache()
+            remaining = response.headers.get("x-ratelimit-remaining", "")
+            if remaining.isdigit():
+                cache["rate_limit"] = {
+                    "remaining": int(remaining),
+                    "reset": int(response.headers.get("x-ratelimit-reset", 0) or 0)
+                }
+            
+            if response.status_code == 304 and entry:
+                entry["fetched_at"] = now
+                cache["repos"][repo] = entry
+                self._save_release_cache()
+                return dict(entry["release"], source="revalidata")
+            
+            if response.status_code in (403, 429) and cache["rate_limit"].get("remaining") == 0:
+                self._save_release_cache()
+                return dict(entry["release"], source="cache (rate limit)") if entry else None
+            
+            response.raise_for_status()
+            data = response.json()
+            release = {
+                "tag": data.get("tag_name"),
+                "name": data.get("name"),
+                "published_at": data.get("published_at"),
+                "html_url": data.get("html_url"),
+                "assets": [
+                    {"name": asset["name"], "url": asset["browser_download_url"], "size": asset.get("size")}
+                    for asset in data.get("assets", [])
+                ]
+            }
+            cache["repos"][repo] = {"etag": response.headers.get("etag"), "fetched_at": now, "release": release}
+            self._save_release_cache()
+            return dict(release, source="api")
+
+    def resolve_releases(self, names=None):
+        """Risolve in parallelo le ultime release di tutti gli artefatti GitHub"""
+        if names is None:
+            names = list(self.config["download_mirrors"])
+        
+        results = {}
+        sources = {}
+        for name in names:
+            source = self._github_release_source(name)
+            if source:
+                sources[name] = source
+            else:
+                results[name] = {"error": "nessun URL di release GitHub"}
+        
+        if not sources:
+            return results
+        
+        with ThreadPoolExecutor(max_workers=len(sources)) as executor:
+            futures = {executor.submit(self.resolve_release, source[0]): name for name, source in sources.items()}
+            for future in as_completed(futures):
+                name = futures[future]
+                repo, tag, asset = sources[name]
+                result = {"repo": repo, "current_tag": tag, "asset": asset}
+                try:
+                    result["latest"] = future.result()
+                    if result["latest"] is None:
+                        result["error"] = "rate limit esaurito"
+                except (requests.exceptions.RequestException, ValueError) as e:
+                    result["error"] = str(e)
+                results[name] = result
+        return {name: results[name] for name in names}
+
+    def _match_release_asset(self, release, current_asset, current_tag):
+        """Trova nella nuova release l'asset che corrisponde a quello attuale"""
+        assets = {asset["name"]: asset["url"] for asset in release.get("assets", [])}
+        old_version = current_tag.lstrip('v')
+        new_version = (release.get("tag") or "").lstrip('v')
+        for candidate in (current_asset, current_asset.replace(old_version, new_version)):
+            if candidate in assets:
+                return assets[candidate]
+        
+        suffix = Path(current_asset).suffix.lower()
+        same_type = [url for name, url in assets.items() if name.lower().endswith(suffix)]
+        return same_type[0] if len(same_type) == 1 else None
+
     def check_for_updates(self):
         """Verifica aggiornamenti"""
         self.clear_screen()
@@ -1425,23 +4320,126 @@ Directory: {self.base_dir}
         print("Controllo versione corrente...")
         print(f"Versione installata: {self.colorize(self.version, 'yellow')}")
         
-        # Qui potresti aggiungere un controllo verso un URL per la versione più recente
-        print("\n" + self.colorize("ℹ️  Funzione di aggiornamento in sviluppo", "yellow"))
-        print("Per ora, verifica manualmente gli aggiornamenti su GitHub.")
+        print("\n" + self.colorize("📦 VERSIONI ARTEFATTI:", "yellow"))
+        start = time.monotonic()
+        results = self.resolve_releases()
+        
+        updates = {}
+        for name, result in results.items():
+            if result.get("error"):
+                print(f"❌ {name}: {result['error']}")
+                continue
+            latest = result["latest"]
+            if latest["tag"] == result["current_tag"]:
+                print(f"✅ {name}: {result['current_tag']} (aggiornato, {latest['source']})")
+                continue
+            new_url = self._match_release_asset(latest, result["asset"], result["current_tag"])
+            print(self.colorize(f"🆕 {name}: {result['current_tag']} → {latest['tag']} ({latest['source']})", "green"))
+            if new_url:
+                updates[name] = (result, new_url)
+            else:
+                print(f"   ⚠️  Asset non riconosciuto, vedi {latest['html_url']}")
+        
+        print(f"\n⏱️  Controllo completato in {time.monotonic() - start:.1f}s")
+        
+        if updates and input("\nAggiornare gli URL nella configurazione? (s/n): ").lower() == 's':
+            for name, (result, new_url) in updates.items():
+                old_url = f"https://github.com/{result['repo']}/releases/download/{result['current_tag']}/{result['asset']}"
+                mirrors = self.config["download_mirrors"][name]
+                if isinstance(mirrors, str):
+                    self.config["download_mirrors"][name] = new_url
+                else:
+                    self.config["download_mirrors"][name] = [new_url if url == old_url else url for url in mirrors]
+            self.save_config()
+            print(self.colorize(f"✅ Aggiornati {len(updates)} artefatti!", "green"))
         
         input("\nPremi INVIO per continuare...")
 
+    def _measure_startup(self):
+        """Avvia il tool in un processo figlio: (ms fino al primo prompt, output di -X importtime)"""
+        import subprocess
+        import tempfile
+        
+        env = dict(os.environ, PYTHONUNBUFFERED="1")
+        with tempfile.TemporaryFile() as stderr:
+            start = time.perf_counter()
+            process = subprocess.Popen(
+                [sys.executable, "-X", "importtime", str(Path(__file__).resolve())],
+                stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=stderr, cwd=self.base_dir, env=env
+            )
+            output = b""
+            elapsed = None
+            # Il primo menu è pronto quando compare il prompt di selezione
+            while elapsed is None:
+                chunk = os.read(process.stdout.fileno(), 65536)
+                if not chunk:
+                    break
+                output += chunk
+                if b"Seleziona opzione" in output:
+                    elapsed = (time.perf_counter() - start) * 1000
+            try:
+                process.communicate(b"0\n", timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+                process.communicate()
+            stderr.seek(0)
+            return elapsed, stderr.read().decode("utf-8", "replace")
+
+    def startup_benchmark(self, budget_ms=None):
+        """Benchmark di avvio: mediana del tempo fino al primo prompt e import più costosi, confrontati col budget"""
+        import statistics
+        
+        budget_ms = budget_ms or self.config.get("startup_budget_ms", 300)
+        runs = max(1, int(self.config.get("startup_benchmark_runs", 5)))
+        print(self.colorize(f"⏱️  BENCHMARK AVVIO ({runs} esecuzioni)", "cyan"))
+        
+        timings = []
+        for _ in range(runs):
+            elapsed, importtime = self._measure_startup()
+            if elapsed is None:
+                print(self.colorize("❌ Il tool non ha raggiunto il primo menu", "red"))
+                return False
+            timings.append(elapsed)
+        
+        # Righe "import time: self [us] | cumulative | nome", indentate per livello di annidamento
+        top_level = []
+        for line in importtime.splitlines():
+            fields = line.split("|")
+            if not line.startswith("import time:") or len(fields) != 3 or not fields[1].strip().isdigit():
+                continue
+            name = fields[2][1:]
+            if not name.startswith(" "):
+                top_level.append((int(fields[1]), name))
+        
+        print("\nImport più costosi (cumulativo, ultima esecuzione):")
+        for cumulative, name in sorted(top_level, reverse=True)[:10]:
+            print(f"   {cumulative / 1000:7.1f} ms  {name}")
+        
+        median = statistics.median(timings)
+        print(f"\nTempo fino al primo prompt: mediana {median:.0f} ms "
+              f"(min {min(timings):.0f}, max {max(timings):.0f}), budget {budget_ms:.0f} ms")
+        if median > budget_ms:
+            print(self.colorize("❌ Budget di avvio superato", "red"))
+            return False
+        print(self.colorize("✅ Avvio entro il budget", "green"))
+        return True
+
     def run(self):
         """Esegue il tool principale"""
         if not self.check_dependencies():
             print(self.colorize("\nImpossibile continuare senza dipendenze.", "red"))
             sys.exit(1)
+        
+        if self.config.get("background_prefetch", False):
+            self.start_prefetch()
             
         try:
             while True:
                 self.clear_screen()
                 self.print_banner()
                 self.print_menu()
+                if self.prefetch_summary():
+                    print(self.prefetch_summary())
                 
                 choice = input(f"\n{self.colorize('Seleziona opzione', 'yellow')} (0-9): ")
                 
@@ -1475,8 +4473,41 @@ Directory: {self.base_dir}
 
 def main():
     """Funzione principale"""
+    parser = argparse.ArgumentParser(description="3DS Modding Tool")
+    parser.add_argument("--export-bundle", metavar="FILE", nargs="?", const="",
+                        help="esporta gli artefatti in un bundle offline ed esce")
+    parser.add_argument("--import-bundle", metavar="FILE",
+                        help="importa un bundle offline in downloads/ ed esce")
+    parser.add_argument("--write-sd-image", metavar="TARGET",
+                        help="scrive la SD preparata come immagine FAT32 su partizione o file immagine ed esce")
+    parser.add_argument("--batch-sd", metavar="PATH", nargs="*",
+                        help="prepara in parallelo le SD indicate (o quelle rilevate) ed esce")
+    parser.add_argument("--verify-sd", metavar="PATH", nargs="+",
+                        help="rilegge dalle SD indicate i file essenziali e li confronta con le sorgenti ed esce")
+    parser.add_argument("--startup-benchmark", metavar="BUDGET_MS", nargs="?", type=float, const=0,
+                        help="misura il tempo di avvio fino al primo menu e fallisce oltre il budget")
+    parser.add_argument("--watch-sd", action="store_true",
+                        help="prepara automaticamente ogni SD inserita (solo Linux)")
+    args = parser.parse_args()
+    
     print("Inizializzazione 3DS Modding Tool...")
     tool = ThreeDSModTool()
+    
+    if args.export_bundle is not None:
+        sys.exit(0 if tool.export_bundle(args.export_bundle or None) else 1)
+    if args.import_bundle:
+        sys.exit(0 if tool.import_bundle(args.import_bundle) else 1)
+    if args.write_sd_image:
+        sys.exit(0 if tool.write_sd_image(args.write_sd_image) else 1)
+    if args.batch_sd is not None:
+        sys.exit(0 if tool.batch_provision(args.batch_sd) else 1)
+    if args.verify_sd:
+        sys.exit(0 if tool.verify_cards(args.verify_sd) else 1)
+    if args.startup_benchmark is not None:
+        sys.exit(0 if tool.startup_benchmark(args.startup_benchmark) else 1)
+    if args.watch_sd:
+        sys.exit(0 if tool.auto_provision() else 1)
+    
     tool.run()
 
 if __name__ == "__main__":
@@ -0,0 +1,192 @@
+"""Download segmentato, ripresa e fallback senza Range contro un server HTTP locale"""
+import hashlib
+import http.server
+import json
+import os
+import re
+import sys
+import tempfile
+import threading
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import Ms17Mod  # noqa: E402
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    """Serve server.data con ETag e, se server.ranges, con supporto a Range/If-Range"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        data = server.data
+        range_header = self.headers.get('Range')
+        if_range = self.headers.get('If-Range')
+        server.requests.append({'range': range_header, 'if_range': if_range})
+        if server.spurious_304:
+            # Proxy difettoso: 304 anche a richieste non condizionali
+            server.spurious_304 -= 1
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        # If-Range valido solo con un ETag forte identico
+        honored = server.ranges and range_header and (
+            if_range is None or (if_range == server.etag and not server.etag.startswith('W/'))
+        )
+        if honored:
+            match = re.match(r'bytes=(\d+)-(\d*)', range_header)
+            start = int(match[1])
+            end = min(int(match[2]) if match[2] else len(data) - 1, len(data) - 1)
+            if start >= len(data):
+                self.send_response(416)
+                self.send_header('Content-Range', f'bytes */{len(data)}')
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+                return
+            body = data[start:end + 1]
+            self.send_response(206)
+            self.send_header('Content-Range', f'bytes {start}-{end}/{len(data)}')
+        else:
+            body = data
+            self.send_response(200)
+        if server.advertise_ranges:
+            self.send_header('Accept-Ranges', 'bytes')
+        self.send_header('ETag', server.etag)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class DownloadTest(unittest.TestCase):
+    SIZE = 6 * 1024 * 1024
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        # La base del tool (downloads/, cache/, config.json) finisce nella cartella temporanea
+        self._module_file = Ms17Mod.__file__
+        Ms17Mod.__file__ = os.path.join(self.tmp.name, "Ms17Mod.py")
+        self.tool = Ms17Mod.ThreeDSModTool()
+        self.tool.config.update({"segmented_download_min_mb": 4, "download_segments": 4})
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _Handler)
+        self.server.data = os.urandom(self.SIZE)
+        self.server.etag = '"v1"'
+        self.server.ranges = True
+        self.server.advertise_ranges = True
+        self.server.requests = []
+        self.server.spurious_304 = 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = f"http://127.0.0.1:{self.server.server_port}/payload.zip"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        Ms17Mod.__file__ = self._module_file
+        self.tmp.cleanup()
+
+    def download(self):
+        ok = self.tool.download_with_progress(self.url, "payload.zip", quiet=True, extract=False)
+        self.assertTrue(ok, self.tool.download_errors)
+        return (self.tool.downloads_dir / "payload.zip").read_bytes()
+
+    def ranged_requests(self):
+        return [request for request in self.server.requests if request['range']]
+
+    def forbid_full_rehash(self):
+        # I digest di un download segmentato devono arrivare senza rileggere tutto il .part
+        def full_rehash(hasher, filepath):
+            raise AssertionError(f"rilettura completa di {filepath}")
+        self.tool._hash_file_into = full_rehash
+
+    def assert_digests(self):
+        sidecar = json.loads((self.tool.downloads_dir / "payload.zip.digests.json").read_text())
+        for algorithm, digest in sidecar["digests"].items():
+            self.assertEqual(digest, hashlib.new(algorithm, self.server.data).hexdigest(), algorithm)
+
+    def test_segmented_download(self):
+        self.forbid_full_rehash()
+        self.assertEqual(self.download(), self.server.data)
+        self.assert_digests()
+        ranged = self.ranged_requests()
+        self.assertEqual(len(ranged), 4)
+        self.assertTrue(all(request['if_range'] == '"v1"' for request in ranged))
+        self.assertEqual(list(self.tool.downloads_dir.glob("*.part*")), [])
+
+    def test_segmented_resume(self):
+        part_path = self.tool.downloads_dir / "payload.zip.part"
+        segment_size = self.SIZE // 4
+        part_path.write_bytes(self.server.data[:segment_size] + bytes(self.SIZE - segment_size))
+        state = {
+            'url': self.url, 'size': self.SIZE, 'etag': '"v1"', 'last_modified': None,
+            'segments': [
+                {'start': start, 'end': start + segment_size - 1, 'done': segment_size if start == 0 else 0}
+                for start in range(0, self.SIZE, segment_size)
+            ],
+        }
+        (self.tool.downloads_dir / "payload.zip.part.segments").write_text(json.dumps(state))
+
+        self.forbid_full_rehash()
+        self.assertEqual(self.download(), self.server.data)
+        self.assert_digests()
+        # Il primo segmento era completo: solo gli altri tre vengono richiesti
+        self.assertEqual(len(self.ranged_requests()), 3)
+
+    def test_single_stream_resume(self):
+        self.tool.config["download_segments"] = 1
+        part_path = self.tool.downloads_dir / "payload.zip.part"
+        part_path.write_bytes(self.server.data[:1024 * 1024])
+        (self.tool.downloads_dir / "payload.zip.part.resume").write_text(
+            json.dumps({'url': self.url, 'etag': '"v1"', 'last_modified': None})
+        )
+
+        self.assertEqual(self.download(), self.server.data)
+        self.assertEqual(self.ranged_requests(), [{'range': 'bytes=1048576-', 'if_range': '"v1"'}])
+
+    def test_resume_after_remote_change_restarts(self):
+        self.tool.config["download_segments"] = 1
+        old_data = self.server.data
+        part_path = self.tool.downloads_dir / "payload.zip.part"
+        part_path.write_bytes(old_data[:4 * 1024 * 1024])
+        (self.tool.downloads_dir / "payload.zip.part.resume").write_text(
+            json.dumps({'url': self.url, 'etag': '"v1"', 'last_modified': None})
+        )
+        self.server.data = os.urandom(self.SIZE)
+        self.server.etag = '"v2"'
+
+        # If-Range non soddisfatto: 200 con il file intero, nessun miscuglio fra versioni
+        self.assertEqual(self.download(), self.server.data)
+
+    def test_no_range_fallback(self):
+        # Accept-Ranges dichiarato ma Range ignorato, con ETag debole
+        self.server.ranges = False
+        self.server.etag = 'W/"v1"'
+        self.assertEqual(self.download(), self.server.data)
+        self.assertEqual(self.ranged_requests(), [])
+
+    def test_range_ignored_falls_back_to_single_stream(self):
+        # ETag forte ma il server risponde 200 alle richieste Range
+        self.server.ranges = False
+        self.assertEqual(self.download(), self.server.data)
+        self.assertEqual(self.tool.download_errors, {})
+        self.assertEqual(list(self.tool.downloads_dir.glob("*.part*")), [])
+
+    def test_unexpected_304_is_a_cache_miss(self):
+        # Nessuna voce di cache: il 304 non richiesto porta a una seconda GET senza condizioni
+        self.server.spurious_304 = 1
+        self.tool.config["download_segments"] = 1
+        self.assertEqual(self.download(), self.server.data)
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_304_without_cache_twice_fails_cleanly(self):
+        self.server.spurious_304 = 2
+        ok = self.tool.download_with_progress(self.url, "payload.zip", quiet=True, extract=False)
+        self.assertFalse(ok)
+        self.assertIn("304", self.tool.download_errors["payload.zip"])
+
+
+if __name__ == "__main__":
+    unittest.main()
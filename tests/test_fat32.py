@@ -0,0 +1,247 @@
+"""Immagine FAT32 scritta su un file sparso da 3 GiB e riletta con un parser FAT32 minimale"""
+import io
+import os
+import struct
+import sys
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import Ms17Mod  # noqa: E402
+
+VOLUME_SIZE = 3 * 1024 ** 3
+END_OF_CHAIN = 0x0FFFFFF8
+
+
+class _Fat32Reader:
+    """Lettore FAT32 di sola lettura: BPB, catene di cluster, directory con LFN"""
+
+    def __init__(self, path):
+        self.f = open(path, 'rb')
+        self.boot = self.read(0, 512)
+        (self.bytes_per_sector, self.sectors_per_cluster, self.reserved, self.num_fats,
+         self.root_entries, self.total16, self.media, self.fat16_size) = struct.unpack_from("<HBHBHHBH", self.boot, 11)
+        self.total_sectors, self.fat_size = struct.unpack_from("<II", self.boot, 32)
+        self.root_cluster, self.fsinfo_sector, self.backup_sector = struct.unpack_from("<IHH", self.boot, 44)
+        self.cluster_size = self.bytes_per_sector * self.sectors_per_cluster
+        self.fat_offset = self.reserved * self.bytes_per_sector
+        self.data_offset = (self.reserved + self.num_fats * self.fat_size) * self.bytes_per_sector
+        self.cluster_count = (self.total_sectors - self.reserved - self.num_fats * self.fat_size) // self.sectors_per_cluster
+
+    def close(self):
+        self.f.close()
+
+    def read(self, offset, size):
+        self.f.seek(offset)
+        data = self.f.read(size)
+        # Oltre la fine scritta il file sparso vale zero, come un dispositivo azzerato
+        return data.ljust(size, b"\0")
+
+    def fat_entry(self, cluster, copy=0):
+        offset = self.fat_offset + copy * self.fat_size * self.bytes_per_sector + cluster * 4
+        return struct.unpack("<I", self.read(offset, 4))[0] & 0x0FFFFFFF
+
+    def chain(self, cluster):
+        clusters = []
+        while 2 <= cluster < END_OF_CHAIN:
+            clusters.append(cluster)
+            cluster = self.fat_entry(cluster)
+        return clusters
+
+    def cluster_data(self, clusters):
+        return b"".join(self.read(self.data_offset + (c - 2) * self.cluster_size, self.cluster_size) for c in clusters)
+
+    def list_dir(self, cluster):
+        """{nome lungo (o 8.3): (attributi, primo cluster, dimensione)}"""
+        data = self.cluster_data(self.chain(cluster))
+        entries = {}
+        lfn_parts = []
+        for offset in range(0, len(data), 32):
+            entry = data[offset:offset + 32]
+            if entry[0] == 0:
+                break
+            attr = entry[11]
+            if attr == 0x0F:
+                order, name1, _, _, checksum, name2, _, name3 = struct.unpack("<B10sBBB12sH4s", entry)
+                lfn_parts.append((order, checksum, name1 + name2 + name3))
+                continue
+            short = entry[:11]
+            if attr & 0x08 or short in (b".          ", b"..         "):
+                lfn_parts = []
+                continue
+            expected_checksum = 0
+            for byte in short:
+                expected_checksum = (((expected_checksum & 1) << 7) + (expected_checksum >> 1) + byte) & 0xFF
+            if lfn_parts:
+                # Voci LFN su disco in ordine inverso; l'ultima ha il bit 0x40
+                assert lfn_parts[0][0] & 0x40, "prima voce LFN senza bit di fine"
+                assert all(checksum == expected_checksum for _, checksum, _ in lfn_parts), "checksum LFN errato"
+                raw = b"".join(part for _, _, part in reversed(lfn_parts))
+                name = raw.decode("utf-16-le").split("\0", 1)[0]
+            else:
+                base, ext = short[:8].decode().rstrip(), short[8:].decode().rstrip()
+                name = f"{base}.{ext}" if ext else base
+            lfn_parts = []
+            high, low, size = struct.unpack_from("<H4xHI", entry, 20)
+            entries[name] = (attr, (high << 16) | low, size)
+        return entries
+
+    def walk(self, cluster=None, prefix=""):
+        """{percorso: bytes} per i file, {percorso/: None} per le directory"""
+        tree = {}
+        for name, (attr, first, size) in self.list_dir(cluster or self.root_cluster).items():
+            path = f"{prefix}{name}"
+            if attr & 0x10:
+                tree[path + "/"] = None
+                tree.update(self.walk(first, path + "/"))
+            else:
+                tree[path] = self.cluster_data(self.chain(first))[:size] if first else b""
+        return tree
+
+
+class Fat32ImageTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.tmp_path = Path(self.tmp.name)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def sparse_target(self):
+        target = self.tmp_path / "sd.img"
+        with open(target, 'wb') as f:
+            f.truncate(VOLUME_SIZE)
+        return target
+
+    def make_tool(self):
+        module_file = Ms17Mod.__file__
+        Ms17Mod.__file__ = str(self.tmp_path / "Ms17Mod.py")
+        self.addCleanup(setattr, Ms17Mod, "__file__", module_file)
+        return Ms17Mod.ThreeDSModTool()
+
+    def read_back(self, path):
+        reader = _Fat32Reader(path)
+        self.addCleanup(reader.close)
+        return reader
+
+    def assert_bpb(self, reader):
+        self.assertEqual(reader.boot[510:512], b"\x55\xAA")
+        self.assertEqual(reader.bytes_per_sector, 512)
+        self.assertEqual(reader.cluster_size, Ms17Mod.FAT32_CLUSTER_SIZE)
+        self.assertEqual(reader.num_fats, 2)
+        # Campi FAT12/16 a zero, dimensioni nei campi a 32 bit
+        self.assertEqual((reader.root_entries, reader.total16, reader.fat16_size), (0, 0, 0))
+        self.assertEqual(reader.media, 0xF8)
+        self.assertEqual(reader.total_sectors, VOLUME_SIZE // 512)
+        self.assertEqual((reader.root_cluster, reader.fsinfo_sector, reader.backup_sector), (2, 1, 6))
+        self.assertEqual(reader.boot[66], 0x29)
+        self.assertEqual(reader.boot[82:90], b"FAT32   ")
+        self.assertGreaterEqual(reader.cluster_count, 65525)
+        # La FAT copre tutti i cluster del volume
+        self.assertGreaterEqual(reader.fat_size * 512 // 4, reader.cluster_count + 2)
+        self.assertEqual(reader.read(6 * 512, 512), reader.boot)
+
+        fsinfo = reader.read(512, 512)
+        self.assertEqual(struct.unpack_from("<I", fsinfo, 0)[0], 0x41615252)
+        self.assertEqual(struct.unpack_from("<I", fsinfo, 484)[0], 0x61417272)
+        self.assertEqual(struct.unpack_from("<I", fsinfo, 508)[0], 0xAA550000)
+        free = struct.unpack_from("<I", fsinfo, 488)[0]
+        used = sum(1 for cluster in range(2, reader.cluster_count + 2) if reader.fat_entry(cluster))
+        self.assertEqual(free, reader.cluster_count - used)
+        self.assertEqual(reader.read(reader.fat_offset, 4096),
+                         reader.read(reader.fat_offset + reader.fat_size * 512, 4096))
+
+    def test_image_tree_round_trip(self):
+        cluster = Ms17Mod.FAT32_CLUSTER_SIZE
+        files = {
+            "boot.firm": os.urandom(3 * cluster + 1234),
+            "3ds/Checkpoint.3dsx": os.urandom(cluster),
+            "luma/payloads/GodMode9.firm": os.urandom(5000),
+            "gm9/scripts/Un nome molto lungo per più voci LFN.gm9": b"print 1\n",
+            "gm9/out/EMPTY.TXT": b"",
+            "a/b/c/d/profondo.bin": os.urandom(40000),
+        }
+        image = Ms17Mod._Fat32Image(VOLUME_SIZE // 512)
+        for directory in Ms17Mod.SD_STRUCTURE:
+            image.add_dir(directory)
+        for path, data in files.items():
+            image.add_file(path, len(data), lambda data=data: io.BytesIO(data))
+
+        image_path = self.tmp_path / "sd.img"
+        image.write(image_path)
+        # Solo fino all'ultimo cluster usato: il resto del volume resta sparso
+        self.assertLess(image_path.stat().st_size, 64 * 1024 * 1024)
+
+        reader = self.read_back(image_path)
+        self.assert_bpb(reader)
+
+        tree = reader.walk()
+        for directory in Ms17Mod.SD_STRUCTURE + ["a", "a/b", "a/b/c", "a/b/c/d"]:
+            self.assertIn(directory + "/", tree)
+        for path, data in files.items():
+            self.assertEqual(tree[path], data, path)
+
+        root = reader.list_dir(reader.root_cluster)
+        _, first, size = root["boot.firm"]
+        chain = reader.chain(first)
+        self.assertEqual(len(chain), -(-size // cluster))
+        self.assertEqual(len(chain), 4)
+        self.assertEqual(reader.fat_entry(chain[-1]), 0x0FFFFFFF)
+        self.assertEqual(reader.fat_entry(chain[-1], copy=1), 0x0FFFFFFF)
+        self.assertEqual(reader.list_dir(root["gm9"][1])["out"][0] & 0x10, 0x10)
+        self.assertEqual(reader.list_dir(reader.list_dir(root["gm9"][1])["out"][1])["EMPTY.TXT"][1:], (0, 0))
+
+    def test_write_sd_image_to_sparse_target(self):
+        tool = self.make_tool()
+
+        payloads = {
+            "luma3ds": ("boot.firm", os.urandom(200000)),
+            "homebrew_launcher": ("boot.3dsx", os.urandom(70000)),
+            "godmode9": ("GodMode9.firm", os.urandom(100)),
+        }
+        for name, (member, data) in payloads.items():
+            with zipfile.ZipFile(tool.downloads_dir / f"{name}.zip", 'w', zipfile.ZIP_DEFLATED) as zip_ref:
+                zip_ref.writestr(member, data)
+
+        target = self.sparse_target()
+        self.assertTrue(tool.write_sd_image(target))
+        self.assertEqual(target.stat().st_size, VOLUME_SIZE)
+
+        reader = self.read_back(target)
+        self.assert_bpb(reader)
+        tree = reader.walk()
+        self.assertEqual(tree["boot.firm"], payloads["luma3ds"][1])
+        self.assertEqual(tree["boot.3dsx"], payloads["homebrew_launcher"][1])
+        self.assertEqual(tree["luma/payloads/GodMode9.firm"], payloads["godmode9"][1])
+        for directory in Ms17Mod.SD_STRUCTURE:
+            self.assertIn(directory + "/", tree)
+
+    def test_card_id_same_for_partition_and_mount(self):
+        tool = self.make_tool()
+        image_path = self.tmp_path / "sd.img"
+        Ms17Mod._Fat32Image(VOLUME_SIZE // 512).write(image_path)
+        volume_id = struct.unpack_from("<I", self.read_back(image_path).boot, 67)[0]
+        mount_dir = self.tmp_path / "mnt"
+        mount_dir.mkdir()
+        # SD montata su mount_dir, con l'immagine come dispositivo sorgente
+        tool._mount_source = lambda path: str(image_path)
+
+        expected = f"vol-{volume_id >> 16:04X}-{volume_id & 0xFFFF:04X}"
+        self.assertEqual(tool._card_identity(image_path), (expected, "boot-sector"))
+        self.assertEqual(tool._card_identity(mount_dir), (expected, "boot-sector"))
+
+        # Con udev il seriale arriva da /dev/disk/by-uuid, senza leggere il dispositivo
+        tool._volume_uuid = lambda source: "ABCD-1234"
+        self.assertEqual(tool._card_identity(image_path), ("vol-ABCD-1234", "by-uuid"))
+        self.assertEqual(tool.card_id(mount_dir), "vol-ABCD-1234")
+
+    def test_volume_too_small_rejected(self):
+        with self.assertRaises(ValueError):
+            Ms17Mod._Fat32Image(256 * 1024 * 1024 // 512)
+
+
+if __name__ == "__main__":
+    unittest.main()
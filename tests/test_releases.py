@@ -0,0 +1,140 @@
+"""Resolver delle release GitHub (TTL, ETag/304, rate limit, asset) contro un'API locale"""
+import http.server
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+import Ms17Mod  # noqa: E402
+
+REPO = "LumaTeam/Luma3DS"
+RELEASE = {
+    "tag_name": "v13.1",
+    "name": "Luma3DS v13.1",
+    "published_at": "2024-01-01T00:00:00Z",
+    "html_url": f"https://github.com/{REPO}/releases/tag/v13.1",
+    "assets": [
+        {"name": "Luma3DSv13.1.zip", "size": 1234,
+         "browser_download_url": f"https://github.com/{REPO}/releases/download/v13.1/Luma3DSv13.1.zip"},
+        {"name": "Luma3DSv13.1.zip.sha256", "size": 64,
+         "browser_download_url": f"https://github.com/{REPO}/releases/download/v13.1/Luma3DSv13.1.zip.sha256"},
+    ],
+}
+
+
+class _ApiHandler(http.server.BaseHTTPRequestHandler):
+    """Stand-in di /repos/<owner>/<repo>/releases/latest con ETag e rate limit"""
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append({"path": self.path, "if_none_match": self.headers.get("If-None-Match")})
+        if server.rate_limited:
+            body = b'{"message": "API rate limit exceeded"}'
+            self.send_response(403)
+            self.send_header("X-RateLimit-Remaining", "0")
+            self.send_header("X-RateLimit-Reset", str(int(time.time()) + 3600))
+        elif self.headers.get("If-None-Match") == '"r1"':
+            self.send_response(304)
+            self.send_header("ETag", '"r1"')
+            self.send_header("X-RateLimit-Remaining", "59")
+            self.end_headers()
+            return
+        else:
+            body = json.dumps(RELEASE).encode()
+            self.send_response(200)
+            self.send_header("ETag", '"r1"')
+            self.send_header("X-RateLimit-Remaining", "59")
+            self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class ReleaseResolverTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self._module_file = Ms17Mod.__file__
+        Ms17Mod.__file__ = os.path.join(self.tmp.name, "Ms17Mod.py")
+        self.tool = Ms17Mod.ThreeDSModTool()
+
+        self.server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), _ApiHandler)
+        self.server.requests = []
+        self.server.rate_limited = False
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.tool.config["github_api_url"] = f"http://127.0.0.1:{self.server.server_port}"
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        Ms17Mod.__file__ = self._module_file
+        self.tmp.cleanup()
+
+    def test_fetch_then_cache_hit_within_ttl(self):
+        self.tool.config["release_cache_ttl"] = 3600
+        first = self.tool.resolve_release(REPO)
+        self.assertEqual(first["source"], "api")
+        self.assertEqual(first["tag"], "v13.1")
+        self.assertEqual(self.server.requests[0]["path"], f"/repos/{REPO}/releases/latest")
+
+        # Anche da un'istanza nuova: la cache è su disco
+        self.tool._release_cache = None
+        second = self.tool.resolve_release(REPO)
+        self.assertEqual(second["source"], "cache")
+        self.assertEqual(second["assets"], first["assets"])
+        self.assertEqual(len(self.server.requests), 1)
+
+    def test_expired_entry_revalidated_with_etag(self):
+        self.tool.config["release_cache_ttl"] = 0
+        self.tool.resolve_release(REPO)
+        revalidated = self.tool.resolve_release(REPO)
+
+        self.assertEqual(revalidated["source"], "revalidata")
+        self.assertEqual(revalidated["tag"], "v13.1")
+        self.assertEqual(self.server.requests[1]["if_none_match"], '"r1"')
+
+    def test_rate_limit_falls_back_to_cache(self):
+        self.tool.config["release_cache_ttl"] = 0
+        self.tool.resolve_release(REPO)
+        self.server.rate_limited = True
+
+        limited = self.tool.resolve_release(REPO)
+        self.assertEqual(limited["source"], "cache (rate limit)")
+        self.assertEqual(limited["tag"], "v13.1")
+        # Limite esaurito fino al reset: nessuna altra richiesta all'API
+        self.assertEqual(self.tool.resolve_release(REPO)["source"], "cache (rate limit)")
+        self.assertEqual(len(self.server.requests), 2)
+
+    def test_rate_limit_without_cache_keeps_configured_url(self):
+        self.server.rate_limited = True
+        configured = self.tool.config["download_mirrors"]["luma3ds"]
+
+        result = self.tool.resolve_releases(["luma3ds"])["luma3ds"]
+        self.assertEqual(result["error"], "rate limit esaurito")
+        self.assertEqual(result["current_tag"], "v13.0")
+        self.assertEqual(self.tool.config["download_mirrors"]["luma3ds"], configured)
+
+    def test_asset_matching(self):
+        release = self.tool.resolve_release(REPO)
+        self.assertEqual(
+            self.tool._match_release_asset(release, "Luma3DSv13.0.zip", "v13.0"),
+            RELEASE["assets"][0]["browser_download_url"]
+        )
+        # Nome non riconducibile e un solo .zip nella release
+        self.assertEqual(
+            self.tool._match_release_asset(release, "luma.zip", "v13.0"),
+            RELEASE["assets"][0]["browser_download_url"]
+        )
+        self.assertIsNone(self.tool._match_release_asset(release, "luma.7z", "v13.0"))
+
+
+if __name__ == "__main__":
+    unittest.main()